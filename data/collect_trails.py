@@ -4,7 +4,7 @@ Philadelphia Hiking Trails App - Data Collection Script
 
 This script collects hiking trail data from OpenStreetMap using the Overpass API
 for Philadelphia and surrounding counties (Bucks, Chester, Delaware, and Montgomery).
-The raw data is saved as JSON files for further processing.
+The raw data is saved as gzip-compressed JSON files for further processing.
 
 Usage:
     python collect_trails.py [--county COUNTY] [--force]
@@ -15,16 +15,25 @@ Options:
 """
 
 import os
-import json
+import re
+import gzip
+import zlib
 import time
+import shutil
 import logging
 import argparse
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 
+import ijson
+import orjson
 import requests
-import overpass
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
@@ -49,102 +58,194 @@ STATE = "Pennsylvania"
 RAW_DATA_DIR = Path("data/raw")
 CACHE_DIR = RAW_DATA_DIR / "cache"
 CACHE_DIR.mkdir(exist_ok=True)
+AREA_IDS_CACHE = CACHE_DIR / "area_ids.json"
 
-# Initialize Overpass API with endpoint from .env or default
+# Overpass API endpoint from .env or default
 OVERPASS_API_URL = os.getenv("OVERPASS_API_URL", "https://overpass-api.de/api/interpreter")
-api = overpass.API(endpoint=OVERPASS_API_URL)
 
 # Request timeout in seconds
 TIMEOUT = 120
 
-# Minimum time between API requests in seconds (to be respectful)
+# Shared HTTP session so the connection to the Overpass API is kept alive
+# across requests, with retry and backoff for rate limiting and server load
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=2,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "POST"])
+    )
+))
+
+# Overpass status endpoint, which reports when the next query slot is free
+OVERPASS_STATUS_URL = OVERPASS_API_URL.rsplit("/", 1)[0] + "/status"
+
+# Time to wait between API requests in seconds when the status endpoint is unavailable
 REQUEST_DELAY = 5
 
+# gzip level for raw data files; Overpass JSON is repetitive enough that the
+# fastest level already compresses it well
+GZIP_COMPRESSLEVEL = 1
 
-def build_trail_query(county):
+# Maximum number of concurrent Overpass requests (the public instance allows two slots per client)
+MAX_CONCURRENT_REQUESTS = 2
+
+# Data types collected for each county, in the order they appear in combined query results
+DATA_TYPES = ["trails", "parks", "poi"]
+
+# Combined query results collected during this run, keyed by county
+_collected_data = {}
+
+# Guards the area ID cache file, which collection workers share
+_area_ids_lock = threading.Lock()
+
+
+# Overpass selectors for each data type in the combined query
+TRAIL_SELECTORS = """
+      way["highway"="path"](area.county);
+      way["highway"="footway"](area.county);
+      way["highway"="track"](area.county);
+      way["route"="hiking"](area.county);
+      relation["route"="hiking"](area.county);
+"""
+
+PARK_SELECTORS = """
+      way["leisure"="park"](area.county);
+      relation["leisure"="park"](area.county);
+      way["boundary"="protected_area"](area.county);
+      relation["boundary"="protected_area"](area.county);
+      way["leisure"="nature_reserve"](area.county);
+      relation["leisure"="nature_reserve"](area.county);
+"""
+
+POI_SELECTORS = """
+      node["tourism"="viewpoint"](area.county);
+      node["natural"="peak"](area.county);
+      node["amenity"="drinking_water"](area.county);
+      node["amenity"="parking"](area.county);
+      node["amenity"="toilets"](area.county);
+      node["information"="guidepost"](area.county);
+      node["tourism"="information"](area.county);
+      node["leisure"="picnic_table"](area.county);
+"""
+
+# Overpass query templates, assembled once at import
+_COUNTY_AREA_BY_NAME_TMPL = string.Template(
+    'area["name"="$county"]["boundary"="administrative"]["admin_level"~"[4-8]"]->.county;'
+)
+
+_COUNTY_AREA_BY_ID_TMPL = string.Template("area(id:$area_ids)->.county;")
+
+_COMBINED_TMPL = string.Template("""
+    [out:json][timeout:$timeout];
+    
+    // Get the county boundary and output its area IDs for caching
+    $county_area
+    .county out ids;
+    
+    // Collect each data type into its own set
+    (""" + TRAIL_SELECTORS + """    )->.trails;
+    (""" + PARK_SELECTORS + """    )->.parks;
+    (""" + POI_SELECTORS + """    )->.poi;
+    
+    // Output trails with their nodes
+    .trails out count;
+    .trails out body;
+    .trails >;
+    out skel qt;
+    
+    // Output parks with their nodes
+    .parks out count;
+    .parks out body;
+    .parks >;
+    out skel qt;
+    
+    // Output points of interest
+    .poi out count;
+    .poi out body;
+    """)
+
+
+def build_county_area(county, area_ids=None):
     """
-    Build Overpass query for hiking trails in a specific county.
+    Build the Overpass statement that selects a county boundary into the .county set.
     
     Args:
         county (str): County name
+        area_ids (list): Overpass area IDs of the county boundary, or None to look it up by name
         
     Returns:
-        str: Overpass QL query
+        str: Overpass QL statement
     """
-    return f"""
-    // Get the county boundary
-    area["name"="{county}"]["boundary"="administrative"]["admin_level"~"[4-8]"]->.county;
+    if area_ids:
+        return _COUNTY_AREA_BY_ID_TMPL.substitute(area_ids=','.join(str(area_id) for area_id in area_ids))
     
-    // Get all hiking trails and paths within the county
-    (
-      way["highway"="path"](area.county);
-      way["highway"="footway"](area.county);
-      way["highway"="track"](area.county);
-      way["route"="hiking"](area.county);
-      relation["route"="hiking"](area.county);
-    );
-    out body;
-    >;
-    out skel qt;
-    """
+    # Escape the name so it cannot break out of the QL string literal
+    escaped_county = county.replace('\\', '\\\\').replace('"', '\\"')
+    return _COUNTY_AREA_BY_NAME_TMPL.substitute(county=escaped_county)
 
 
-def build_park_query(county):
+def build_combined_query(county, area_ids=None):
     """
-    Build Overpass query for parks and protected areas in a specific county.
+    Build a single Overpass query for trails, parks, and POIs in a specific county.
+    
+    The county boundary is resolved once and its area IDs are output first, for
+    cache_area_ids. Each data type is then collected into its own named set.
+    Every set is preceded by an ``out count`` element in the response, which
+    split_combined_result uses to separate the data types.
     
     Args:
         county (str): County name
+        area_ids (list): Overpass area IDs of the county boundary, or None to look it up by name
         
     Returns:
         str: Overpass QL query
     """
-    return f"""
-    // Get the county boundary
-    area["name"="{county}"]["boundary"="administrative"]["admin_level"~"[4-8]"]->.county;
+    return _COMBINED_TMPL.substitute(timeout=TIMEOUT, county_area=build_county_area(county, area_ids))
+
+
+def split_combined_result(result):
+    """
+    Split the response of a combined query into one result per data type.
     
-    // Get all parks and protected areas within the county
-    (
-      way["leisure"="park"](area.county);
-      relation["leisure"="park"](area.county);
-      way["boundary"="protected_area"](area.county);
-      relation["boundary"="protected_area"](area.county);
-      way["leisure"="nature_reserve"](area.county);
-      relation["leisure"="nature_reserve"](area.county);
-    );
-    out body;
-    >;
-    out skel qt;
+    Args:
+        result (dict): Overpass response for a query built by build_combined_query
+        
+    Returns:
+        dict: Results keyed by data type, each in the single-type response format
     """
+    sections = []
+    for element in result.get('elements', []):
+        if element.get('type') == 'count':
+            sections.append([])
+        elif sections:
+            sections[-1].append(element)
+    
+    if len(sections) != len(DATA_TYPES):
+        raise ValueError(f"Expected {len(DATA_TYPES)} sections in combined result, found {len(sections)}")
+    
+    header = {k: v for k, v in result.items() if k != 'elements'}
+    return {
+        data_type: {**header, 'elements': elements}
+        for data_type, elements in zip(DATA_TYPES, sections)
+    }
 
 
-def build_poi_query(county):
+def raw_data_filename(county, data_type):
     """
-    Build Overpass query for points of interest related to hiking in a specific county.
+    Get the file name of the raw data for a county and data type.
     
     Args:
         county (str): County name
+        data_type (str): Type of data (trails, parks, poi)
         
     Returns:
-        str: Overpass QL query
-    """
-    return f"""
-    // Get the county boundary
-    area["name"="{county}"]["boundary"="administrative"]["admin_level"~"[4-8]"]->.county;
-    
-    // Get all hiking-related points of interest within the county
-    (
-      node["tourism"="viewpoint"](area.county);
-      node["natural"="peak"](area.county);
-      node["amenity"="drinking_water"](area.county);
-      node["amenity"="parking"](area.county);
-      node["amenity"="toilets"](area.county);
-      node["information"="guidepost"](area.county);
-      node["tourism"="information"](area.county);
-      node["leisure"="picnic_table"](area.county);
-    );
-    out body;
+        str: File name of the gzip-compressed JSON data
     """
+    return f"{county.lower()}_{data_type}_raw.json.gz"
 
 
 def should_collect(county, data_type, force=False):
@@ -159,120 +260,205 @@ def should_collect(county, data_type, force=False):
     Returns:
         bool: True if data should be collected, False otherwise
     """
-    file_path = RAW_DATA_DIR / f"{county.lower()}_{data_type}_raw.json"
+    file_path = RAW_DATA_DIR / raw_data_filename(county, data_type)
     return force or not file_path.exists()
 
 
-def collect_data(county, query, data_type, force=False):
+def get_overpass_slot_wait():
+    """
+    Get the time until an Overpass query slot is available for this client.
+    
+    Returns:
+        int: Seconds to wait, 0 if a slot is available now
     """
-    Collect data using Overpass API and save to file.
+    try:
+        response = SESSION.get(OVERPASS_STATUS_URL, timeout=10)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logging.warning(f"Could not read Overpass status, waiting {REQUEST_DELAY}s: {str(e)}")
+        return REQUEST_DELAY
+    
+    # "2 slots available now." or "Slot available after: 2024-01-01T00:00:00Z, in 3 seconds."
+    if re.search(r"^[1-9]\d* slots? available now", response.text, re.MULTILINE):
+        return 0
+    waits = [int(seconds) for seconds in re.findall(r"in (\d+) seconds", response.text)]
+    return min(waits) if waits else 0
+
+
+def run_query(query):
+    """
+    Send an Overpass QL query to the Overpass API once a query slot is free.
+    Rate-limited (429) responses are retried by the session, which honors
+    the Retry-After header.
     
     Args:
-        county (str): County name
         query (str): Overpass QL query
-        data_type (str): Type of data (trails, parks, poi)
-        force (bool): Force recollection even if data exists
         
     Returns:
-        dict: Collected data or None if collection failed
+        dict: Parsed JSON response
     """
-    county_lower = county.lower()
-    output_path = RAW_DATA_DIR / f"{county_lower}_{data_type}_raw.json"
+    wait = get_overpass_slot_wait()
+    if wait > 0:
+        logging.info(f"Waiting {wait}s for an Overpass query slot")
+        time.sleep(wait + 1)
     
-    # Check if data should be collected
-    if not should_collect(county, data_type, force):
-        logging.info(f"Data for {county} {data_type} already exists, skipping collection")
-        try:
-            with open(output_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logging.error(f"Error loading existing data for {county} {data_type}: {str(e)}")
-            # Continue with collection if loading fails
+    response = SESSION.post(OVERPASS_API_URL, data={"data": query}, timeout=TIMEOUT)
+    response.raise_for_status()
+    result = orjson.loads(response.content)
     
-    logging.info(f"Collecting {data_type} data for {county} County")
+    # Overpass reports query failures in a remark rather than the status code
+    remark = result.get('remark', '')
+    if remark.startswith('runtime error'):
+        raise RuntimeError(remark)
     
-    try:
-        # Execute the query
-        start_time = time.time()
-        result = api.get(query, responseformat="json")
-        
-        # Save raw data
-        with open(output_path, 'w') as f:
-            json.dump(result, f, indent=2)
-        
-        # Save a cache copy
-        cache_path = CACHE_DIR / f"{county_lower}_{data_type}_raw.json"
-        with open(cache_path, 'w') as f:
-            json.dump(result, f, indent=2)
-        
-        element_count = len(result.get('elements', []))
-        logging.info(f"Collected {element_count} elements for {county} {data_type}")
-        
-        # Respect rate limits
-        elapsed = time.time() - start_time
-        if elapsed < REQUEST_DELAY:
-            time.sleep(REQUEST_DELAY - elapsed)
-            
-        return result
-    except Exception as e:
-        logging.error(f"Error collecting {data_type} data for {county}: {str(e)}")
-        
-        # Try to use cached data if available
-        cache_path = CACHE_DIR / f"{county_lower}_{data_type}_raw.json"
-        if cache_path.exists():
-            logging.info(f"Using cached data for {county} {data_type}")
-            try:
-                with open(cache_path, 'r') as f:
-                    return json.load(f)
-            except Exception as cache_e:
-                logging.error(f"Error loading cached data: {str(cache_e)}")
+    return result
+
+
+def load_area_ids(county):
+    """
+    Get the cached Overpass area IDs of a county boundary.
+    
+    Args:
+        county (str): County name
         
-        return None
+    Returns:
+        list: Area IDs, or None if they have not been cached yet
+    """
+    with _area_ids_lock:
+        cached = load_data(AREA_IDS_CACHE) if AREA_IDS_CACHE.exists() else {}
+    return cached.get(county)
 
 
-def collect_trails_for_county(county, force=False):
+def cache_area_ids(county, result):
     """
-    Collect hiking trails for a specific county.
+    Cache the county area IDs output at the start of a combined query response,
+    so later queries can select the area directly instead of searching by name.
     
     Args:
         county (str): County name
-        force (bool): Force recollection even if data exists
+        result (dict): Overpass response for a query built by build_combined_query
+    """
+    area_ids = []
+    for element in result.get('elements', []):
+        if element.get('type') == 'count':
+            break
+        if element.get('type') == 'area':
+            area_ids.append(element['id'])
+    
+    if not area_ids:
+        return
+    
+    with _area_ids_lock:
+        cached = load_data(AREA_IDS_CACHE) if AREA_IDS_CACHE.exists() else {}
+        if cached.get(county) == area_ids:
+            return
+        cached[county] = area_ids
+        with open(AREA_IDS_CACHE, 'wb') as f:
+            f.write(orjson.dumps(cached, option=orjson.OPT_INDENT_2))
+    logging.info(f"Cached {county} County boundary area IDs {area_ids}")
+
+
+def load_data(file_path):
+    """
+    Load previously collected data from a JSON file, which may be gzip-compressed.
+    
+    Args:
+        file_path (Path): Path to the JSON file
         
     Returns:
-        dict: Collected trail data or None if collection failed
+        dict: Loaded data
     """
-    query = build_trail_query(county)
-    return collect_data(county, query, "trails", force)
+    opener = gzip.open if file_path.suffix == '.gz' else open
+    with opener(file_path, 'rb') as f:
+        return orjson.loads(f.read())
 
 
-def collect_parks_for_county(county, force=False):
+def collect_data(county, force=False):
     """
-    Collect park boundaries for a specific county.
+    Collect trails, parks, and POIs for a county using a single Overpass API
+    request and save each data type to its own file.
     
     Args:
         county (str): County name
         force (bool): Force recollection even if data exists
         
     Returns:
-        dict: Collected park data or None if collection failed
+        dict: Collected data keyed by data type, or None if collection failed
     """
-    query = build_park_query(county)
-    return collect_data(county, query, "parks", force)
+    # Check if data should be collected
+    if not any(should_collect(county, data_type, force) for data_type in DATA_TYPES):
+        logging.info(f"Data for {county} already exists, skipping collection")
+        try:
+            return {
+                data_type: load_data(RAW_DATA_DIR / raw_data_filename(county, data_type))
+                for data_type in DATA_TYPES
+            }
+        except Exception as e:
+            logging.error(f"Error loading existing data for {county}: {str(e)}")
+            # Continue with collection if loading fails
+    
+    logging.info(f"Collecting {', '.join(DATA_TYPES)} data for {county} County")
+    
+    try:
+        # Execute the combined query
+        query = build_combined_query(county, load_area_ids(county))
+        response = run_query(query)
+        cache_area_ids(county, response)
+        results = split_combined_result(response)
+        
+        for data_type, result in results.items():
+            output_path = RAW_DATA_DIR / raw_data_filename(county, data_type)
+            
+            # Save raw data as compressed compact JSON
+            with gzip.open(output_path, 'wb', compresslevel=GZIP_COMPRESSLEVEL) as f:
+                f.write(orjson.dumps(result))
+            
+            # Save a cache copy
+            cache_path = CACHE_DIR / raw_data_filename(county, data_type)
+            shutil.copyfile(output_path, cache_path)
+            
+            element_count = len(result.get('elements', []))
+            logging.info(f"Collected {element_count} elements for {county} {data_type}")
+        
+        return results
+    except Exception as e:
+        logging.error(f"Error collecting data for {county}: {str(e)}")
+        
+        # Try to use cached data if available
+        results = {}
+        for data_type in DATA_TYPES:
+            cache_path = CACHE_DIR / raw_data_filename(county, data_type)
+            if not cache_path.exists():
+                return None
+            logging.info(f"Using cached data for {county} {data_type}")
+            try:
+                results[data_type] = load_data(cache_path)
+            except Exception as cache_e:
+                logging.error(f"Error loading cached data: {str(cache_e)}")
+                return None
+        
+        return results
 
 
-def collect_poi_for_county(county, force=False):
+def collect_county_data(county, force=False):
     """
-    Collect points of interest for a specific county.
+    Collect all data types for a specific county, reusing the result of an
+    earlier collection for the same county during this run.
     
     Args:
         county (str): County name
         force (bool): Force recollection even if data exists
         
     Returns:
-        dict: Collected POI data or None if collection failed
+        dict: Collected data keyed by data type, or None if collection failed
     """
-    query = build_poi_query(county)
-    return collect_data(county, query, "poi", force)
+    if county not in _collected_data:
+        results = collect_data(county, force)
+        if results is None:
+            return None
+        _collected_data[county] = results
+    
+    return _collected_data[county]
 
 
 def validate_collected_data(counties=None):
@@ -290,34 +476,32 @@ def validate_collected_data(counties=None):
     if counties is None:
         counties = COUNTIES
     
-    data_types = ["trails", "parks", "poi"]
     all_valid = True
     
+    # List the raw data directory once instead of checking each file for existence
+    with os.scandir(RAW_DATA_DIR) as it:
+        entries = {entry.name for entry in it if entry.is_file()}
+    
     for county in counties:
-        county_lower = county.lower()
-        for data_type in data_types:
-            file_path = RAW_DATA_DIR / f"{county_lower}_{data_type}_raw.json"
+        for data_type in DATA_TYPES:
+            file_name = raw_data_filename(county, data_type)
+            file_path = RAW_DATA_DIR / file_name
             
-            if not file_path.exists():
+            if file_name not in entries:
                 logging.warning(f"Missing data file: {file_path}")
                 all_valid = False
                 continue
                 
-            # Check file size
-            if file_path.stat().st_size < 100:  # Arbitrary small size
-                logging.warning(f"Suspiciously small data file: {file_path}")
-                all_valid = False
-                
-            # Basic JSON validation
+            # Basic JSON validation, streaming only up to the first element
             try:
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
+                with gzip.open(file_path, 'rb') as f:
+                    has_elements = any(True for _ in ijson.items(f, 'elements.item'))
                     
-                if 'elements' not in data or len(data['elements']) == 0:
+                if not has_elements:
                     logging.warning(f"No elements found in {file_path}")
                     all_valid = False
-            except json.JSONDecodeError:
-                logging.error(f"Invalid JSON in {file_path}")
+            except (ijson.JSONError, OSError, EOFError, zlib.error):
+                logging.error(f"Invalid compressed JSON in {file_path}")
                 all_valid = False
     
     if all_valid:
@@ -347,20 +531,13 @@ def collect_all_data(counties=None, force=False):
     
     success = True
     
-    for county in counties:
-        logging.info(f"Processing {county} County")
-        
-        # Collect trails
-        if collect_trails_for_county(county, force) is None:
-            success = False
-            
-        # Collect parks
-        if collect_parks_for_county(county, force) is None:
-            success = False
-            
-        # Collect POIs
-        if collect_poi_for_county(county, force) is None:
-            success = False
+    # Collect trails, parks, and POIs for several counties at once, one request per county
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        futures = {executor.submit(collect_county_data, county, force): county for county in counties}
+        for future in as_completed(futures):
+            if future.result() is None:
+                logging.error(f"Data collection failed for {futures[future]} County")
+                success = False
     
     # Validate collected data
     if not validate_collected_data(counties):
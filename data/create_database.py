@@ -19,10 +19,15 @@ import sqlite3
 import json
 import logging
 import argparse
+import tempfile
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+from utils import init_worker_logging
+
 # Set up logging
 log_dir = Path("data/logs")
 log_dir.mkdir(exist_ok=True)
@@ -44,10 +49,89 @@ ASSETS_DIR = Path("assets")
 ASSETS_DIR.mkdir(exist_ok=True)
 DB_PATH = ASSETS_DIR / "trails.db"
 
+# Columns imported from the processed CSV files, in table insert order
+TRAIL_COLUMNS = ['id', 'name', 'difficulty', 'length_miles', 'county', 'start_lat', 'start_lon', 'status']
+TRAIL_POINT_COLUMNS = ['trail_id', 'sequence', 'latitude', 'longitude']
+
+# Numeric column types for reading the processed CSV files; coordinates stay
+# float64 so no precision is lost before they are stored as SQLite REALs
+TRAIL_DTYPES = {'length_miles': 'float64', 'start_lat': 'float64', 'start_lon': 'float64'}
+TRAIL_POINT_DTYPE = np.dtype([
+    ('trail_id', 'U64'), ('sequence', 'int32'), ('latitude', 'float64'), ('longitude', 'float64')
+])
+
+# PRAGMAs applied while bulk loading, trading durability for insert speed
+BULK_LOAD_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=OFF;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-262144;
+PRAGMA locking_mode=EXCLUSIVE;
+PRAGMA mmap_size=268435456;
+"""
+
+# Triggers that keep trails_rtree in step with writes to trails after the build.
+# The R*Tree is keyed by trails rowid, so a row replaced by INSERT OR REPLACE
+# (which gets a new rowid) has its old entry removed before the insert
+TRAILS_RTREE_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trails_rtree_before_insert BEFORE INSERT ON trails
+    BEGIN
+        DELETE FROM trails_rtree WHERE id_rt IN (SELECT rowid FROM trails WHERE id = NEW.id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trails_rtree_after_insert AFTER INSERT ON trails
+    WHEN NEW.start_lat IS NOT NULL AND NEW.start_lon IS NOT NULL
+    BEGIN
+        INSERT INTO trails_rtree (id_rt, min_lat, max_lat, min_lon, max_lon)
+        VALUES (NEW.rowid, NEW.start_lat, NEW.start_lat, NEW.start_lon, NEW.start_lon);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trails_rtree_after_update AFTER UPDATE ON trails
+    BEGIN
+        DELETE FROM trails_rtree WHERE id_rt = OLD.rowid;
+        INSERT INTO trails_rtree (id_rt, min_lat, max_lat, min_lon, max_lon)
+        SELECT NEW.rowid, NEW.start_lat, NEW.start_lat, NEW.start_lon, NEW.start_lon
+        WHERE NEW.start_lat IS NOT NULL AND NEW.start_lon IS NOT NULL;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trails_rtree_after_delete AFTER DELETE ON trails
+    BEGIN
+        DELETE FROM trails_rtree WHERE id_rt = OLD.rowid;
+    END
+    '''
+]
+
+
+def begin_bulk_load(conn):
+    """
+    Configure the connection for fast bulk loading.
+    
+    Args:
+        conn (sqlite3.Connection): SQLite connection
+    """
+    conn.executescript(BULK_LOAD_PRAGMAS)
+
+
+def end_bulk_load(conn):
+    """
+    Restore durable settings after bulk loading and fold the write-ahead log
+    back into the database file, so the bundled database is a single file.
+    
+    Args:
+        conn (sqlite3.Connection): SQLite connection
+    """
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA journal_mode=DELETE")
+
 
-def create_database_schema(conn):
+def create_tables(conn):
     """
-    Create the database schema.
+    Create the database tables.
     
     Args:
         conn (sqlite3.Connection): SQLite connection
@@ -84,6 +168,15 @@ def create_database_schema(conn):
         )
         ''')
         
+        # Create R*Tree spatial index of trail start coordinates, keyed by trails rowid
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS trails_rtree USING rtree(
+            id_rt,
+            min_lat, max_lat,
+            min_lon, max_lon
+        )
+        ''')
+        
         # Create app_metadata table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS app_metadata (
@@ -92,22 +185,89 @@ def create_database_schema(conn):
         )
         ''')
         
+        conn.commit()
+        logging.info("Database tables created successfully")
+        return True
+    
+    except Exception as e:
+        logging.error(f"Error creating database tables: {str(e)}")
+        conn.rollback()
+        return False
+
+
+def drop_indexes(conn):
+    """
+    Drop indexes and triggers left by a previous build so they are not
+    maintained during import.
+    
+    Args:
+        conn (sqlite3.Connection): SQLite connection
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        cursor = conn.cursor()
+        
+        # Automatic indexes backing PRIMARY KEY constraints have no SQL and cannot be dropped
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+        
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='trigger'")
+        for (trigger_name,) in cursor.fetchall():
+            cursor.execute(f'DROP TRIGGER IF EXISTS "{trigger_name}"')
+        
+        conn.commit()
+        return True
+    
+    except Exception as e:
+        logging.error(f"Error dropping database indexes: {str(e)}")
+        conn.rollback()
+        return False
+
+
+def create_indexes(conn):
+    """
+    Create the database indexes and the triggers that keep the R*Tree current.
+    Called after the data is imported so each index is built once instead of
+    being updated on every insert.
+    
+    Args:
+        conn (sqlite3.Connection): SQLite connection
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        cursor = conn.cursor()
+        
         # Create spatial index on trail_points
         cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_trail_points_trail_id ON trail_points(trail_id)
         ''')
         
-        # Create spatial index on trails for start coordinates
+        # Fill the R*Tree with trail start coordinates for bounding box queries:
+        #   SELECT t.* FROM trails t JOIN trails_rtree r ON r.id_rt = t.rowid
+        #   WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?
+        cursor.execute("DELETE FROM trails_rtree")
         cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_trails_start_coords ON trails(start_lat, start_lon)
+        INSERT INTO trails_rtree (id_rt, min_lat, max_lat, min_lon, max_lon)
+        SELECT rowid, start_lat, start_lat, start_lon, start_lon
+        FROM trails
+        WHERE start_lat IS NOT NULL AND start_lon IS NOT NULL
         ''')
         
+        # Keep the R*Tree in step with later writes to trails
+        for trigger_sql in TRAILS_RTREE_TRIGGERS:
+            cursor.execute(trigger_sql)
+        
         conn.commit()
-        logging.info("Database schema created successfully")
+        logging.info("Database indexes created successfully")
         return True
     
     except Exception as e:
-        logging.error(f"Error creating database schema: {str(e)}")
+        logging.error(f"Error creating database indexes: {str(e)}")
         conn.rollback()
         return False
 
@@ -131,27 +291,24 @@ def import_trails_data(conn, county):
         return False
     
     try:
-        # Read trails data
-        trails_df = pd.read_csv(trails_file)
-        
-        # Insert trails data
+        # Read trails data; the pyarrow engine only accepts a list for usecols,
+        # so the header is read first to leave out columns the file lacks
+        header = pd.read_csv(trails_file, nrows=0).columns
+        usecols = [column for column in TRAIL_COLUMNS if column in header]
+        trails_df = pd.read_csv(trails_file, engine='pyarrow', usecols=usecols, dtype=TRAIL_DTYPES)
+        
+        # Trails without a status are open
+        if 'status' not in trails_df.columns:
+            trails_df['status'] = 'open'
+        trails_df['status'] = trails_df['status'].fillna('open')
+        
+        # Insert trails data in a single batch
         cursor = conn.cursor()
-        
-        for _, trail in trails_df.iterrows():
-            cursor.execute('''
-            INSERT OR REPLACE INTO trails (
-                id, name, difficulty, length_miles, county, start_lat, start_lon, status
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                trail['id'],
-                trail['name'],
-                trail['difficulty'],
-                trail['length_miles'],
-                trail['county'],
-                trail['start_lat'],
-                trail['start_lon'],
-                trail.get('status', 'open')
-            ))
+        cursor.executemany('''
+        INSERT OR REPLACE INTO trails (
+            id, name, difficulty, length_miles, county, start_lat, start_lon, status
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', trails_df[TRAIL_COLUMNS].itertuples(index=False, name=None))
         
         conn.commit()
         logging.info(f"Imported {len(trails_df)} trails for {county}")
@@ -182,26 +339,26 @@ def import_trail_points_data(conn, county):
         return False
     
     try:
-        # Read trail points data
-        points_df = pd.read_csv(points_file)
+        # Map the insert columns to their positions in the CSV header
+        with open(points_file, encoding='utf-8') as f:
+            header = f.readline().strip().split(',')
+        usecols = [header.index(column) for column in TRAIL_POINT_COLUMNS]
+        
+        # Parse trail points straight into a structured NumPy array
+        points = np.loadtxt(
+            points_file, delimiter=',', skiprows=1, usecols=usecols,
+            dtype=TRAIL_POINT_DTYPE, ndmin=1, encoding='utf-8'
+        )
         
-        # Insert trail points data
+        # Insert trail points data, converting columns to native Python values
         cursor = conn.cursor()
-        
-        for _, point in points_df.iterrows():
-            cursor.execute('''
-            INSERT INTO trail_points (
-                trail_id, sequence, latitude, longitude
-            ) VALUES (?, ?, ?, ?)
-            ''', (
-                point['trail_id'],
-                point['sequence'],
-                point['latitude'],
-                point['longitude']
-            ))
+        cursor.executemany(
+            'INSERT INTO trail_points (trail_id, sequence, latitude, longitude) VALUES (?, ?, ?, ?)',
+            zip(*(points[column].tolist() for column in TRAIL_POINT_COLUMNS))
+        )
         
         conn.commit()
-        logging.info(f"Imported {len(points_df)} trail points for {county}")
+        logging.info(f"Imported {len(points)} trail points for {county}")
         return True
     
     except Exception as e:
@@ -210,6 +367,83 @@ def import_trail_points_data(conn, county):
         return False
 
 
+def import_county_database(county, work_dir):
+    """
+    Import trails and trail points for a county into a separate database.
+    Runs in a worker process so counties are imported in parallel.
+    
+    Args:
+        county (str): County name
+        work_dir (str): Directory for the county database
+        
+    Returns:
+        tuple: (Path, bool) - Path to the county database and success flag
+    """
+    county_db_path = Path(work_dir) / f"trails_{county.lower()}.db"
+    
+    logging.info(f"Importing data for {county} County")
+    
+    conn = sqlite3.connect(county_db_path)
+    begin_bulk_load(conn)
+    
+    success = create_tables(conn)
+    
+    # Import trails data
+    if not import_trails_data(conn, county):
+        success = False
+    
+    # Import trail points data
+    if not import_trail_points_data(conn, county):
+        success = False
+    
+    conn.close()
+    return county_db_path, success
+
+
+def merge_county_database(conn, county, county_db_path):
+    """
+    Copy the trails and trail points of a county database into the main database.
+    
+    Args:
+        conn (sqlite3.Connection): SQLite connection to the main database
+        county (str): County name
+        county_db_path (Path): Path to the county database
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        conn.execute("ATTACH DATABASE ? AS county_db", (str(county_db_path),))
+        try:
+            conn.execute('''
+            INSERT OR REPLACE INTO trails (
+                id, name, difficulty, length_miles, county, start_lat, start_lon, status
+            )
+            SELECT id, name, difficulty, length_miles, county, start_lat, start_lon, status
+            FROM county_db.trails
+            ''')
+            
+            # Trail point IDs are assigned by the main database
+            conn.execute('''
+            INSERT INTO trail_points (trail_id, sequence, latitude, longitude)
+            SELECT trail_id, sequence, latitude, longitude
+            FROM county_db.trail_points
+            ORDER BY id
+            ''')
+            
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE county_db")
+        
+        logging.info(f"Merged data for {county} County")
+        return True
+    
+    except Exception as e:
+        logging.error(f"Error merging data for {county}: {str(e)}")
+        conn.rollback()
+        return False
+
+
 def add_metadata(conn):
     """
     Add metadata to the database.
@@ -311,29 +545,47 @@ def create_database(counties=None, force=False):
         
         # Connect to database
         conn = sqlite3.connect(DB_PATH)
+        begin_bulk_load(conn)
         
-        # Create schema
-        if not create_database_schema(conn):
+        # Create tables without indexes
+        if not create_tables(conn) or not drop_indexes(conn):
             conn.close()
             return False
         
-        # Import data for each county
+        # Import each county into its own database in parallel, then merge them
         success = True
-        for county in counties:
-            logging.info(f"Importing data for {county} County")
-            
-            # Import trails data
-            if not import_trails_data(conn, county):
-                success = False
-            
-            # Import trail points data
-            if not import_trail_points_data(conn, county):
-                success = False
+        with tempfile.TemporaryDirectory() as work_dir:
+            max_workers = min(len(counties), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logging, initargs=(log_file,)) as executor:
+                futures = {county: executor.submit(import_county_database, county, work_dir) for county in counties}
+                
+                for county, future in futures.items():
+                    # Only merge counties whose import completed
+                    try:
+                        county_db_path, county_success = future.result()
+                    except Exception as e:
+                        logging.error(f"Error importing data for {county}: {str(e)}")
+                        success = False
+                        continue
+                    
+                    if not county_success:
+                        logging.error(f"Import failed for {county}, skipping merge")
+                        success = False
+                        continue
+                    
+                    if not merge_county_database(conn, county, county_db_path):
+                        success = False
+        
+        # Create indexes on the imported data
+        if not create_indexes(conn):
+            success = False
         
         # Add metadata
         if not add_metadata(conn):
             success = False
         
+        end_bulk_load(conn)
+        
         # Validate database
         if not validate_database(conn):
             success = False
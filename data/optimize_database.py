@@ -34,6 +34,9 @@ logging.basicConfig(
     ]
 )
 
+# Maximum rows sampled per index when gathering query planner statistics
+ANALYSIS_LIMIT = 400
+
 def add_indexes(conn):
     """
     Add indexes to the database for frequently queried fields.
@@ -87,10 +90,14 @@ def add_indexes(conn):
             logging.info("Adding index for is_accessible")
             cursor.execute('CREATE INDEX idx_trails_is_accessible ON trails(is_accessible)')
         
-        # Add index for latitude and longitude (for location-based queries)
+        # Add index for latitude and longitude (for location-based queries),
+        # skipping rows without coordinates since they never match a location query
         if 'idx_trails_location' not in existing_indexes:
             logging.info("Adding index for latitude and longitude")
-            cursor.execute('CREATE INDEX idx_trails_location ON trails(latitude, longitude)')
+            cursor.execute('''
+            CREATE INDEX idx_trails_location ON trails(latitude, longitude)
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ''')
         
         # Add index for park_id
         if 'idx_trails_park_id' not in existing_indexes:
@@ -110,7 +117,10 @@ def add_indexes(conn):
         # Add index for parks location
         if 'idx_parks_location' not in existing_indexes:
             logging.info("Adding index for parks location")
-            cursor.execute('CREATE INDEX idx_parks_location ON parks(latitude, longitude)')
+            cursor.execute('''
+            CREATE INDEX idx_parks_location ON parks(latitude, longitude)
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ''')
         
         conn.commit()
         logging.info("Indexes added successfully")
@@ -123,7 +133,7 @@ def add_indexes(conn):
 
 def optimize_database(db_path):
     """
-    Optimize the database by adding indexes and running ANALYZE.
+    Optimize the database by adding indexes, updating statistics and vacuuming.
     
     Args:
         db_path (str): Path to the database file
@@ -145,17 +155,32 @@ def optimize_database(db_path):
             conn.close()
             return False
         
-        # Run ANALYZE to update statistics
-        logging.info("Running ANALYZE to update statistics")
-        conn.execute("ANALYZE")
-        
-        # Run VACUUM to optimize storage
+        # Update statistics, sampling a limited number of rows per index. Once
+        # the database has statistics, PRAGMA optimize only re-analyzes stale
+        # tables (0x10000 checks every table, not just the ones this connection
+        # has queried); it skips never-analyzed databases, so those get ANALYZE
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'")
+        if cursor.fetchone():
+            logging.info("Running PRAGMA optimize to update statistics")
+            conn.execute("PRAGMA optimize=0x10002")
+        else:
+            logging.info("Running ANALYZE to gather statistics")
+            conn.execute("ANALYZE")
+        
+        # Vacuum into a new file and swap it in, instead of vacuuming in place
+        # which needs room for both a temporary copy and a rollback journal
         logging.info("Running VACUUM to optimize storage")
-        conn.execute("VACUUM")
+        optimized_path = f"{db_path}.optimized"
+        if os.path.exists(optimized_path):
+            os.remove(optimized_path)
+        conn.execute("VACUUM INTO ?", (optimized_path,))
         
         # Close connection
         conn.close()
         
+        os.replace(optimized_path, db_path)
+        
         logging.info(f"Database optimization completed successfully for {db_path}")
         return True
     
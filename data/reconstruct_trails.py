@@ -18,9 +18,12 @@ import os
 import json
 import logging
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import networkx as nx
@@ -28,9 +31,8 @@ from shapely.geometry import LineString, Point
 
 from utils import (
     # OSM utils
-    load_osm_data,
-    extract_nodes_from_osm_data,
-    extract_ways_from_osm_data,
+    iter_osm_elements,
+    extract_all_from_osm_data,
     filter_trail_ways,
     estimate_trail_difficulty,
     get_trail_name,
@@ -40,7 +42,10 @@ from utils import (
     
     # Spatial utils
     calculate_trail_length,
-    simplify_geometry
+    simplify_geometry,
+    
+    # Logging utils
+    init_worker_logging
 )
 
 # Set up logging
@@ -63,6 +68,9 @@ RAW_DATA_DIR = Path("data/raw")
 PROCESSED_DATA_DIR = Path("data/processed")
 PROCESSED_DATA_DIR.mkdir(exist_ok=True)
 
+# Attribute columns of the processed trails, in output order
+TRAIL_COLUMNS = ['id', 'name', 'difficulty', 'length_miles', 'county', 'start_lat', 'start_lon', 'status']
+
 
 def should_process(county, force=False):
     """
@@ -79,13 +87,15 @@ def should_process(county, force=False):
     return force or not output_path.exists()
 
 
-def process_county(county, force=False):
+def process_county(county, force=False, n_workers=1):
     """
     Process trail data for a specific county.
     
     Args:
         county (str): County name
         force (bool): Force reprocessing even if output files already exist
+        n_workers (int): Worker processes for decomposing large trail networks,
+            or -1 to use all cores (default: 1)
         
     Returns:
         bool: True if processing was successful, False otherwise
@@ -100,22 +110,18 @@ def process_county(county, force=False):
     logging.info(f"Processing trail data for {county} County")
     
     # Load raw trail data
-    trails_file = RAW_DATA_DIR / f"{county_lower}_trails_raw.json"
+    trails_file = RAW_DATA_DIR / f"{county_lower}_trails_raw.json.gz"
     if not trails_file.exists():
         logging.error(f"Raw trail data file not found: {trails_file}")
         return False
     
     try:
-        # Load OSM data
-        osm_data = load_osm_data(trails_file)
-        if not osm_data:
-            logging.error(f"Failed to load OSM data from {trails_file}")
+        # Extract nodes and ways in a single pass over the file's elements
+        nodes, ways, _ = extract_all_from_osm_data(iter_osm_elements(trails_file))
+        if not nodes and not ways:
+            logging.error(f"No OSM data found in {trails_file}")
             return False
         
-        # Extract nodes and ways
-        nodes = extract_nodes_from_osm_data(osm_data)
-        ways = extract_ways_from_osm_data(osm_data)
-        
         logging.info(f"Extracted {len(nodes)} nodes and {len(ways)} ways")
         
         # Filter ways to include only trails
@@ -123,16 +129,18 @@ def process_county(county, force=False):
         logging.info(f"Filtered to {len(trail_ways)} trail ways")
         
         # Reconstruct trails
-        trails = reconstruct_trails(nodes, trail_ways)
+        trails = reconstruct_trails(nodes, trail_ways, n_workers)
         logging.info(f"Reconstructed {len(trails)} trails")
         
+        # Skip invalid trails, keeping each trail's position for its ID
+        valid_trails = [(i, trail) for i, trail in enumerate(trails) if trail and 'geometry' in trail]
+        
+        # Simplify all geometries in one vectorized call
+        geometries = simplify_geometry([trail['geometry'] for _, trail in valid_trails])
+        
         # Process trails
         processed_trails = []
-        for i, trail in enumerate(trails):
-            # Skip invalid trails
-            if not trail or 'geometry' not in trail:
-                continue
-            
+        for (i, trail), geometry in zip(valid_trails, geometries):
             # Get trail attributes
             trail_id = f"{county_lower}_{i+1}"
             tags = trail.get('tags', {})
@@ -147,9 +155,6 @@ def process_county(county, force=False):
             else:
                 start_lon, start_lat = None, None
             
-            # Simplify geometry
-            geometry = simplify_geometry(trail['geometry'])
-            
             # Create processed trail
             processed_trail = {
                 'id': trail_id,
@@ -165,18 +170,20 @@ def process_county(county, force=False):
             
             processed_trails.append(processed_trail)
         
-        # Create GeoDataFrame
         if processed_trails:
-            gdf = gpd.GeoDataFrame(processed_trails, crs="EPSG:4326")
+            # Create a plain DataFrame of the trail attributes
+            df = pd.DataFrame(processed_trails, columns=TRAIL_COLUMNS)
+            
+            # Create GeoDataFrame from the attributes and simplified geometries
+            gdf = gpd.GeoDataFrame(df, geometry=geometries, crs="EPSG:4326")
             
-            # Save to GeoJSON
+            # Save to GeoJSON with pyogrio's columnar writer
             output_path = PROCESSED_DATA_DIR / f"{county_lower}_trails.geojson"
-            gdf.to_file(output_path, driver='GeoJSON')
+            gdf.to_file(output_path, driver='GeoJSON', engine='pyogrio')
             
-            # Save to CSV (without geometry column)
+            # Save to CSV straight from the attributes, without geometry
             csv_path = PROCESSED_DATA_DIR / f"{county_lower}_trails.csv"
-            gdf_csv = gdf.drop(columns=['geometry'])
-            gdf_csv.to_csv(csv_path, index=False)
+            df.to_csv(csv_path, index=False)
             
             logging.info(f"Saved {len(processed_trails)} processed trails to {output_path}")
             
@@ -207,36 +214,33 @@ def process_trail_points(county, trails):
     county_lower = county.lower()
     
     try:
-        # Create trail points
-        trail_points = []
-        
+        # Collect the coordinate array of each LineString trail
+        trail_ids = []
+        trail_coords = []
         for trail in trails:
-            trail_id = trail['id']
             geometry = trail['geometry']
-            
-            # Extract coordinates from geometry
             if isinstance(geometry, LineString):
-                coordinates = list(geometry.coords)
-                
-                # Create trail points
-                for i, (lon, lat) in enumerate(coordinates):
-                    point = {
-                        'trail_id': trail_id,
-                        'sequence': i,
-                        'latitude': lat,
-                        'longitude': lon
-                    }
-                    trail_points.append(point)
+                trail_ids.append(trail['id'])
+                trail_coords.append(np.asarray(geometry.coords).reshape(-1, 2))
         
-        # Create DataFrame
-        if trail_points:
-            df = pd.DataFrame(trail_points)
+        # Create DataFrame from whole columns rather than a dict per point
+        counts = [len(coords) for coords in trail_coords]
+        total_points = sum(counts)
+        if total_points:
+            coords = np.concatenate(trail_coords)
+            offsets = np.repeat(np.cumsum(counts) - counts, counts)
+            df = pd.DataFrame({
+                'trail_id': np.repeat(np.array(trail_ids, dtype=object), counts),
+                'sequence': np.arange(total_points) - offsets,
+                'latitude': coords[:, 1],
+                'longitude': coords[:, 0]
+            })
             
             # Save to CSV
             output_path = PROCESSED_DATA_DIR / f"{county_lower}_trail_points.csv"
             df.to_csv(output_path, index=False)
             
-            logging.info(f"Saved {len(trail_points)} trail points to {output_path}")
+            logging.info(f"Saved {total_points} trail points to {output_path}")
             
             return True
         else:
@@ -262,13 +266,16 @@ def process_all_counties(counties=None, force=False):
     if counties is None:
         counties = COUNTIES
     
-    success = True
+    # A single county uses all cores for its own large trail networks
+    if len(counties) == 1:
+        return process_county(counties[0], force, n_workers=-1)
     
-    for county in counties:
-        if not process_county(county, force):
-            success = False
+    # Counties are independent, so process them in parallel worker processes
+    max_workers = min(len(counties), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logging, initargs=(log_file,)) as executor:
+        results = list(executor.map(partial(process_county, force=force), counties))
     
-    return success
+    return all(results)
 
 
 def parse_arguments():
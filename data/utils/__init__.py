@@ -8,6 +8,7 @@ OpenStreetMap data processing.
 
 from .spatial_utils import (
     haversine,
+    haversine_precomputed,
     calculate_trail_length,
     create_line_string,
     buffer_point,
@@ -22,12 +23,17 @@ from .graph_utils import (
     find_endpoints,
     find_junctions,
     find_path_between_endpoints,
+    walk_simple_trail,
+    path_from_predecessors,
     create_trail_from_path,
+    add_trail_geometries,
+    find_trail_chains,
     decompose_complex_network,
     reconstruct_trails
 )
 
 from .osm_utils import (
+    extract_all_from_osm_data,
     extract_nodes_from_osm_data,
     extract_ways_from_osm_data,
     extract_relations_from_osm_data,
@@ -36,12 +42,18 @@ from .osm_utils import (
     filter_poi_nodes,
     estimate_trail_difficulty,
     get_trail_name,
-    load_osm_data
+    load_osm_data,
+    iter_osm_elements
+)
+
+from .logging_utils import (
+    init_worker_logging
 )
 
 __all__ = [
     # Spatial utils
     'haversine',
+    'haversine_precomputed',
     'calculate_trail_length',
     'create_line_string',
     'buffer_point',
@@ -55,11 +67,16 @@ __all__ = [
     'find_endpoints',
     'find_junctions',
     'find_path_between_endpoints',
+    'walk_simple_trail',
+    'path_from_predecessors',
     'create_trail_from_path',
+    'add_trail_geometries',
+    'find_trail_chains',
     'decompose_complex_network',
     'reconstruct_trails',
     
     # OSM utils
+    'extract_all_from_osm_data',
     'extract_nodes_from_osm_data',
     'extract_ways_from_osm_data',
     'extract_relations_from_osm_data',
@@ -68,5 +85,9 @@ __all__ = [
     'filter_poi_nodes',
     'estimate_trail_difficulty',
     'get_trail_name',
-    'load_osm_data'
+    'load_osm_data',
+    'iter_osm_elements',
+    
+    # Logging utils
+    'init_worker_logging'
 ]
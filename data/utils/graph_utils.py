@@ -6,10 +6,29 @@ This module provides utility functions for graph-based operations on trail data,
 including graph construction, path finding, and trail reconstruction.
 """
 
+import os
 import logging
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
 import networkx as nx
+import shapely
+from scipy.sparse.csgraph import connected_components, floyd_warshall, shortest_path
 from shapely.geometry import LineString
-from .spatial_utils import haversine
+from .spatial_utils import haversine_precomputed
+
+# Number of endpoints whose shortest paths are computed in one SciPy call, which
+# bounds the predecessor matrix to this many rows of component nodes
+SHORTEST_PATH_BATCH_SIZE = 64
+
+# Components up to this many nodes get all shortest paths from one dense
+# Floyd-Warshall pass, which beats Dijkstra's per-call setup at this size
+FLOYD_WARSHALL_MAX_NODES = 64
+
+# Components with at least this many nodes are decomposed in worker processes
+# when reconstruct_trails is given workers; smaller ones cost more to send to a
+# worker than to decompose in place
+PARALLEL_MIN_COMPONENT_NODES = 500
 
 
 def create_graph_from_osm_elements(nodes, ways):
@@ -21,42 +40,57 @@ def create_graph_from_osm_elements(nodes, ways):
         ways (dict): Dictionary of OSM ways with way_id as key
         
     Returns:
-        networkx.Graph: Graph representing the trail network
+        networkx.Graph: Graph representing the trail network, with the node
+            coordinates also stored as an array in G.graph['node_coords']
     """
     G = nx.Graph()
     
     # Add all nodes to the graph
-    for node_id, node_data in nodes.items():
-        G.add_node(node_id, **node_data)
+    G.add_nodes_from(nodes.items())
     
-    # Add all ways as edges
+    # Keep (lon, lat) of every node in one array, indexed through node_index
+    node_index = {node_id: i for i, node_id in enumerate(nodes)}
+    node_coords = np.array(
+        [(node_data['lon'], node_data['lat']) for node_data in nodes.values()], dtype=float
+    ).reshape(-1, 2)
+    G.graph['node_index'] = node_index
+    G.graph['node_coords'] = node_coords
+    
+    # Collect the consecutive node pairs of every way
+    segment_nodes = []
+    segment_ways = []
     for way_id, way_data in ways.items():
-        # Skip ways with fewer than 2 nodes
-        if len(way_data['nodes']) < 2:
-            continue
-            
-        # Add edges between consecutive nodes in the way
-        for i in range(len(way_data['nodes']) - 1):
-            node1 = way_data['nodes'][i]
-            node2 = way_data['nodes'][i + 1]
-            
+        way_nodes = way_data['nodes']
+        
+        # Pair up consecutive nodes in the way
+        for node1, node2 in zip(way_nodes, way_nodes[1:]):
             # Skip if either node is not in the graph
-            if node1 not in G or node2 not in G:
+            if node1 not in node_index or node2 not in node_index:
                 continue
-                
-            # Calculate distance between nodes
-            distance = haversine(
-                G.nodes[node1]['lon'], G.nodes[node1]['lat'],
-                G.nodes[node2]['lon'], G.nodes[node2]['lat']
-            )
             
-            # Add edge with attributes
-            G.add_edge(
-                node1, node2,
-                distance=distance,
-                way_id=way_id,
-                **way_data.get('tags', {})
-            )
+            segment_nodes.append((node_index[node1], node_index[node2]))
+            segment_ways.append(way_id)
+    
+    # Convert each node to radians and take the cosine of its latitude once,
+    # since most nodes are shared by two or more segments
+    node_radians = np.radians(node_coords)
+    node_cos_lat = np.cos(node_radians[:, 1])
+    
+    # Calculate all segment distances in one vectorized pass
+    segment_index = np.array(segment_nodes, dtype=np.intp).reshape(-1, 2)
+    start, end = segment_index[:, 0], segment_index[:, 1]
+    distances = haversine_precomputed(
+        node_radians[start, 0], node_radians[start, 1], node_cos_lat[start],
+        node_radians[end, 0], node_radians[end, 1], node_cos_lat[end]
+    ).tolist()
+    
+    # Add all edges in one batch; edges only point at their way, whose tags
+    # are looked up in the ways dictionary when a trail is created
+    node_ids = list(nodes)
+    G.add_edges_from(
+        (node_ids[i1], node_ids[i2], {'distance': distance, 'way_id': way_id})
+        for (i1, i2), way_id, distance in zip(segment_nodes, segment_ways, distances)
+    )
     
     return G
 
@@ -71,33 +105,52 @@ def find_connected_components(G):
     Returns:
         list: List of sets of nodes, each set representing a connected component
     """
-    return list(nx.connected_components(G))
+    if G.number_of_nodes() == 0:
+        return []
+    
+    # Label components with SciPy's compiled search over the adjacency matrix
+    nodelist = list(G)
+    adjacency = nx.to_scipy_sparse_array(G, nodelist=nodelist, weight=None, format='csr')
+    n_components, labels = connected_components(adjacency, directed=False)
+    
+    # Group nodes by component label
+    components = [set() for _ in range(n_components)]
+    for node, label in zip(nodelist, labels.tolist()):
+        components[label].add(node)
+    
+    return components
 
 
-def find_endpoints(G):
+def find_endpoints(G, degrees=None):
     """
     Find endpoints (nodes with degree 1) in the graph.
     
     Args:
         G (networkx.Graph): Graph representing the trail network
+        degrees (dict): Degree of each node, if already computed
         
     Returns:
         list: List of node IDs that are endpoints
     """
-    return [n for n in G.nodes() if G.degree(n) == 1]
+    if degrees is None:
+        degrees = dict(G.degree())
+    return [n for n, degree in degrees.items() if degree == 1]
 
 
-def find_junctions(G):
+def find_junctions(G, degrees=None):
     """
     Find junctions (nodes with degree > 2) in the graph.
     
     Args:
         G (networkx.Graph): Graph representing the trail network
+        degrees (dict): Degree of each node, if already computed
         
     Returns:
         list: List of node IDs that are junctions
     """
-    return [n for n in G.nodes() if G.degree(n) > 2]
+    if degrees is None:
+        degrees = dict(G.degree())
+    return [n for n, degree in degrees.items() if degree > 2]
 
 
 def find_path_between_endpoints(G, start, end):
@@ -118,13 +171,70 @@ def find_path_between_endpoints(G, start, end):
         return None
 
 
-def create_trail_from_path(G, path):
+def walk_simple_trail(G, start):
+    """
+    Follow a simple trail (a chain with no junctions) from one of its endpoints.
+    
+    Args:
+        G (networkx.Graph): Graph of a single chain of nodes
+        start (int): Endpoint node ID to start from
+        
+    Returns:
+        list: List of node IDs from the start endpoint to the other endpoint
+    """
+    path = [start]
+    previous = None
+    current = start
+    while True:
+        next_nodes = [n for n in G[current] if n != previous]
+        if not next_nodes:
+            break
+        previous, current = current, next_nodes[0]
+        path.append(current)
+    
+    return path
+
+
+def path_from_predecessors(predecessors, start, end, nodelist):
+    """
+    Rebuild a shortest path from a SciPy predecessor row.
+    
+    Args:
+        predecessors (list): Predecessor index of each node, as returned by
+            scipy.sparse.csgraph.shortest_path for the start node
+        start (int): Index of the start node
+        end (int): Index of the end node
+        nodelist (list): Node IDs in matrix index order
+        
+    Returns:
+        list: List of node IDs representing the path, or None if unreachable
+    """
+    if start == end:
+        return None
+    if predecessors[end] < 0:
+        return None
+    
+    # Walk back from the end node to the start node
+    path = [end]
+    while path[-1] != start:
+        path.append(predecessors[path[-1]])
+    
+    return [nodelist[i] for i in reversed(path)]
+
+
+def create_trail_from_path(G, path, ways, length=None, build_geometry=True):
     """
     Create a trail object from a path in the graph.
     
     Args:
         G (networkx.Graph): Graph representing the trail network
         path (list): List of node IDs representing the path
+        ways (dict): Dictionary of OSM ways with way_id as key
+        length (float): Path length in miles if already known, e.g. from a
+            shortest path search (default: summed from the edge distances)
+        build_geometry (bool): Build the trail's LineString now; if False the
+            geometry is None and the coordinates are left as an (n, 2) array
+            for add_trail_geometries (default: True)
         
     Returns:
         dict: Trail object with attributes
@@ -132,39 +242,37 @@ def create_trail_from_path(G, path):
     if not path or len(path) < 2:
         return None
         
-    # Extract coordinates
-    coordinates = [(G.nodes[n]['lon'], G.nodes[n]['lat']) for n in path]
+    # Extract coordinates, gathering them from the graph's coordinate array when
+    # it was built by create_graph_from_osm_elements
+    node_coords = G.graph.get('node_coords')
+    if node_coords is not None:
+        node_index = G.graph['node_index']
+        path_index = np.fromiter((node_index[n] for n in path), dtype=np.intp, count=len(path))
+        path_coords = node_coords[path_index]
+        coordinates = path_coords.tolist() if build_geometry else path_coords
+    else:
+        coordinates = [(G.nodes[n]['lon'], G.nodes[n]['lat']) for n in path]
+        path_coords = coordinates
     
     # Calculate length
-    length = sum(G[path[i]][path[i+1]]['distance'] for i in range(len(path)-1))
-    
-    # Collect tags from edges
-    tags = {}
-    for i in range(len(path)-1):
-        edge_tags = {k: v for k, v in G[path[i]][path[i+1]].items() 
-                    if k not in ['distance', 'way_id']}
-        for k, v in edge_tags.items():
-            if k not in tags:
-                tags[k] = []
-            tags[k].append(v)
-    
-    # Resolve tag conflicts (most common value wins)
-    resolved_tags = {}
-    for k, v in tags.items():
-        if not v:
-            continue
-        # Count occurrences of each value
-        value_counts = {}
-        for val in v:
-            if val not in value_counts:
-                value_counts[val] = 0
-            value_counts[val] += 1
-        # Use the most common value
-        resolved_tags[k] = max(value_counts.items(), key=lambda x: x[1])[0]
+    if length is None:
+        length = sum(G[path[i]][path[i+1]]['distance'] for i in range(len(path)-1))
+    
+    # Count the path's segments on each way, so each way's tags are read once
+    way_segments = Counter(G[u][v]['way_id'] for u, v in zip(path, path[1:]))
+    
+    # Collect tag votes, weighting each way's values by its segment count
+    tags = defaultdict(Counter)
+    for way_id, segments in way_segments.items():
+        for k, v in ways[way_id].get('tags', {}).items():
+            tags[k][v] += segments
+    
+    # Resolve tag conflicts (most common value wins, ties go to the first seen)
+    resolved_tags = {k: votes.most_common(1)[0][0] for k, votes in tags.items()}
     
     # Create trail object
     trail = {
-        'geometry': LineString(coordinates),
+        'geometry': LineString(path_coords) if build_geometry else None,
         'coordinates': coordinates,
         'length_miles': length,
         'tags': resolved_tags
@@ -181,83 +289,197 @@ def create_trail_from_path(G, path):
     return trail
 
 
-def decompose_complex_network(G, max_pairs=10000):
+def add_trail_geometries(trails):
+    """
+    Build the LineString geometries of many trails in one vectorized call.
+    
+    Args:
+        trails (list): Trails created with build_geometry=False; their
+            coordinates are converted back to lists of [lon, lat]
+    """
+    if not trails:
+        return
+    
+    # Pack every trail's coordinates into one array, with the trail each row belongs to
+    trail_coords = [np.asarray(trail['coordinates'], dtype=float) for trail in trails]
+    counts = [len(coords) for coords in trail_coords]
+    geometries = shapely.linestrings(
+        np.concatenate(trail_coords), indices=np.repeat(np.arange(len(trails)), counts)
+    )
+    
+    for trail, geometry, coords in zip(trails, geometries.tolist(), trail_coords):
+        trail['geometry'] = geometry
+        trail['coordinates'] = coords.tolist()
+
+
+def find_trail_chains(G, degrees=None):
+    """
+    Split a trail network into chains of edges between junctions and endpoints.
+    
+    Every edge is walked exactly once, so the chains cover the network without
+    overlapping. Cycles with no junction or endpoint are returned as closed chains.
+    
+    Args:
+        G (networkx.Graph): Graph representing the trail network
+        degrees (dict): Degree of each node, if already computed
+        
+    Returns:
+        list: List of paths, each a list of node IDs
+    """
+    chains = []
+    visited = set()
+    
+    def edge_key(u, v):
+        return (u, v) if u <= v else (v, u)
+    
+    def walk(start, neighbor):
+        # Follow degree-2 nodes until reaching a junction, an endpoint or the start
+        path = [start, neighbor]
+        visited.add(edge_key(start, neighbor))
+        current = neighbor
+        while current not in stops and current != start:
+            next_node = next((n for n in G[current] if edge_key(current, n) not in visited), None)
+            if next_node is None:
+                break
+            visited.add(edge_key(current, next_node))
+            path.append(next_node)
+            current = next_node
+        return path
+    
+    # Chains start and stop at junctions and endpoints
+    if degrees is None:
+        degrees = dict(G.degree())
+    stops = {n for n, degree in degrees.items() if degree != 2}
+    for start in sorted(stops):
+        for neighbor in G[start]:
+            if edge_key(start, neighbor) not in visited:
+                chains.append(walk(start, neighbor))
+    
+    # Any edges left over belong to cycles made only of degree-2 nodes
+    for u, v in G.edges():
+        if edge_key(u, v) not in visited:
+            chains.append(walk(u, v))
+    
+    return chains
+
+
+def decompose_complex_network(G, ways, max_pairs=10000, degrees=None):
     """
     Decompose a complex trail network into individual trails.
     
+    Networks with more endpoint pairs than max_pairs are split into chains
+    between junctions and endpoints instead of enumerating every pair.
+    
     Args:
         G (networkx.Graph): Graph representing the trail network
-        max_pairs (int): Maximum number of endpoint pairs to process (default: 10000)
+        ways (dict): Dictionary of OSM ways with way_id as key
+        max_pairs (int): Maximum number of endpoint pairs to enumerate (default: 10000)
+        degrees (dict): Degree of each node, if already computed
         
     Returns:
         list: List of trails
     """
     trails = []
     
-    # Find endpoints
-    endpoints = find_endpoints(G)
+    # Find endpoints from a single snapshot of the node degrees
+    if degrees is None:
+        degrees = dict(G.degree())
+    endpoints = find_endpoints(G, degrees)
     
     # If there are exactly two endpoints, this is a simple trail
     if len(endpoints) == 2:
-        logging.info(f"Simple trail with 2 endpoints - finding path")
-        path = find_path_between_endpoints(G, endpoints[0], endpoints[1])
+        logging.info("Simple trail with 2 endpoints - finding path")
+        
+        # Without junctions or loops the only path is the chain itself, so walk
+        # it rather than running a shortest path search
+        if G.number_of_edges() == G.number_of_nodes() - 1:
+            path = walk_simple_trail(G, endpoints[0])
+        else:
+            path = find_path_between_endpoints(G, endpoints[0], endpoints[1])
         if path:
-            trail = create_trail_from_path(G, path)
+            trail = create_trail_from_path(G, path, ways)
             if trail:
                 trails.append(trail)
         return trails
     
     # For more complex networks, find all pairs of endpoints
     total_pairs = len(endpoints) * (len(endpoints) - 1) // 2
-    actual_pairs_to_process = min(total_pairs, max_pairs)
     
+    # Too many pairs to enumerate, so cover each edge once with a chain instead
     if total_pairs > max_pairs:
-        logging.warning(f"Network has {total_pairs} endpoint pairs, limiting to {max_pairs} pairs")
-        logging.info(f"Processing {actual_pairs_to_process}/{total_pairs} endpoint pairs (limit applied)")
-    else:
-        logging.info(f"Complex network with {len(endpoints)} endpoints - processing {total_pairs} endpoint pairs")
+        logging.warning(f"Network has {total_pairs} endpoint pairs, splitting into chains between junctions")
+        for chain in find_trail_chains(G, degrees):
+            trail = create_trail_from_path(G, chain, ways, build_geometry=False)
+            if trail:
+                trails.append(trail)
+        add_trail_geometries(trails)
+        logging.info(f"Split network into {len(trails)} trails")
+        return trails
+    
+    logging.info("Complex network with %d endpoints - processing %d endpoint pairs", len(endpoints), total_pairs)
     
     # Sort endpoints by some criteria to prioritize important pairs
     # For simplicity, we'll use node ID as a proxy, but this could be improved
     sorted_endpoints = sorted(endpoints)
     
+    # Build a sparse distance matrix so shortest paths run in SciPy's compiled code
+    nodelist = list(G)
+    node_index = {n: i for i, n in enumerate(nodelist)}
+    endpoint_indices = [node_index[n] for n in sorted_endpoints]
+    distance_matrix = nx.to_scipy_sparse_array(G, nodelist=nodelist, weight='distance', format='csr')
+    
+    # Small components get every shortest path from a single Floyd-Warshall pass
+    use_floyd_warshall = len(nodelist) <= FLOYD_WARSHALL_MAX_NODES
+    if use_floyd_warshall:
+        all_lengths, all_predecessors = floyd_warshall(
+            distance_matrix, directed=False, return_predecessors=True
+        )
+    
     pair_counter = 0
-    for i in range(len(sorted_endpoints)):
-        for j in range(i+1, len(sorted_endpoints)):
-            # Check if we've reached the maximum number of pairs
-            if pair_counter >= max_pairs:
-                logging.info(f"Reached maximum of {max_pairs} endpoint pairs, stopping processing")
-                break
-                
-            pair_counter += 1
-            if pair_counter % 100 == 0:  # Log every 100 pairs
-                logging.info(f"Processing endpoint pair {pair_counter}/{actual_pairs_to_process}")
-                
-            start = sorted_endpoints[i]
-            end = sorted_endpoints[j]
-            
-            # Find path between endpoints
-            path = find_path_between_endpoints(G, start, end)
-            if path:
-                trail = create_trail_from_path(G, path)
-                if trail:
-                    trails.append(trail)
+    for batch_start in range(0, len(endpoint_indices) - 1, SHORTEST_PATH_BATCH_SIZE):
+        sources = endpoint_indices[batch_start:batch_start + SHORTEST_PATH_BATCH_SIZE]
+        if use_floyd_warshall:
+            lengths, predecessors = all_lengths[sources], all_predecessors[sources]
+        else:
+            # Run Dijkstra from a batch of endpoints in one call, so each endpoint
+            # is explored once rather than once per pair
+            lengths, predecessors = shortest_path(
+                distance_matrix, method='D', directed=False,
+                return_predecessors=True, indices=sources
+            )
         
-        # Check again after the inner loop
-        if pair_counter >= max_pairs:
-            break
+        for k, start in enumerate(sources):
+            row = predecessors[k].tolist()
+            row_lengths = lengths[k].tolist()
+            
+            for end in endpoint_indices[batch_start + k + 1:]:
+                pair_counter += 1
+                if pair_counter % 100 == 0:  # Log every 100 pairs
+                    logging.info("Processing endpoint pair %d/%d", pair_counter, total_pairs)
+                
+                # Rebuild the path to the other endpoint
+                path = path_from_predecessors(row, start, end, nodelist)
+                if path:
+                    trail = create_trail_from_path(G, path, ways, row_lengths[end], build_geometry=False)
+                    if trail:
+                        trails.append(trail)
+    
+    # Build all the trail geometries in one call rather than one per trail
+    add_trail_geometries(trails)
     
-    logging.info(f"Completed processing {pair_counter}/{total_pairs} endpoint pairs, found {len(trails)} trails")
+    logging.info("Completed processing %d/%d endpoint pairs, found %d trails", pair_counter, total_pairs, len(trails))
     return trails
 
 
-def reconstruct_trails(nodes, ways):
+def reconstruct_trails(nodes, ways, n_workers=1):
     """
     Reconstruct trails from OSM nodes and ways.
     
     Args:
         nodes (dict): Dictionary of OSM nodes with node_id as key
         ways (dict): Dictionary of OSM ways with way_id as key
+        n_workers (int): Worker processes for decomposing large components, or
+            -1 to use all cores (default: 1, decompose in this process)
         
     Returns:
         list: List of reconstructed trails
@@ -266,25 +488,63 @@ def reconstruct_trails(nodes, ways):
     G = create_graph_from_osm_elements(nodes, ways)
     logging.info(f"Created graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
     
-    # Find connected components
-    components = find_connected_components(G)
-    logging.info(f"Found {len(components)} connected components")
+    # Find connected components, skipping isolated nodes up front since they
+    # cannot form a trail (e.g. nodes that only belonged to filtered-out ways)
+    all_components = find_connected_components(G)
+    components = [component for component in all_components if len(component) > 1]
+    logging.info(f"Found {len(components)} connected components ({len(all_components) - len(components)} isolated nodes skipped)")
     
-    # Process each connected component
-    trails = []
-    for i, component in enumerate(components):
-        logging.info(f"Processing component {i+1}/{len(components)} with {len(component)} nodes")
-        
-        # Extract subgraph for this component
-        subgraph = G.subgraph(component).copy()
-        
-        # Log the number of endpoints in this component
-        endpoints = find_endpoints(subgraph)
-        logging.info(f"Component {i+1} has {len(endpoints)} endpoints")
+    # Start worker processes only if there are large components to send them
+    if n_workers == -1:
+        n_workers = os.cpu_count() or 1
+    executor = None
+    if n_workers > 1 and any(len(component) >= PARALLEL_MIN_COMPONENT_NODES for component in components):
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+    
+    # Process each connected component. Per-component messages use deferred
+    # formatting, since counties have thousands of components
+    results = []
+    try:
+        for i, component in enumerate(components):
+            logging.info("Processing component %d/%d with %d nodes", i+1, len(components), len(component))
+            
+            # Extract subgraph for this component. A read-only view would avoid
+            # building a graph, but NetworkX filters every adjacency lookup on a
+            # view, which makes the edge lookups in decompose_complex_network much
+            # slower. Building the copy straight from G's nodes and edges skips the
+            # view that G.subgraph(component).copy() copies through, and adds nodes
+            # and edges in the same order as that copy
+            component_nodes = list(component)
+            subgraph = nx.Graph()
+            subgraph.graph.update(G.graph)
+            subgraph.add_nodes_from((n, G.nodes[n]) for n in component_nodes)
+            subgraph.add_edges_from(G.edges(component_nodes, data=True))
+            
+            # Log the number of endpoints in this component, computing the degrees
+            # once for both the count and the decomposition
+            degrees = dict(subgraph.degree())
+            logging.info("Component %d has %d endpoints", i+1, len(find_endpoints(subgraph, degrees)))
+            
+            if executor and len(component) >= PARALLEL_MIN_COMPONENT_NODES:
+                # Send the component to a worker with only its own coordinates
+                # and ways, rather than those of the whole county
+                node_index = G.graph['node_index']
+                subgraph.graph['node_index'] = {n: k for k, n in enumerate(component_nodes)}
+                subgraph.graph['node_coords'] = G.graph['node_coords'][[node_index[n] for n in component_nodes]]
+                component_ways = {way_id: ways[way_id] for _, _, way_id in subgraph.edges(data='way_id')}
+                results.append(executor.submit(decompose_complex_network, subgraph, component_ways, degrees=degrees))
+            else:
+                # Decompose into trails
+                results.append(decompose_complex_network(subgraph, ways, degrees=degrees))
         
-        # Decompose into trails
-        component_trails = decompose_complex_network(subgraph)
-        logging.info(f"Extracted {len(component_trails)} trails from component {i+1}")
-        trails.extend(component_trails)
+        # Collect trails in component order
+        trails = []
+        for i, result in enumerate(results):
+            component_trails = result.result() if isinstance(result, Future) else result
+            logging.info("Extracted %d trails from component %d", len(component_trails), i+1)
+            trails.extend(component_trails)
+    finally:
+        if executor:
+            executor.shutdown()
     
     return trails
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Logging utility functions for the Philadelphia Hiking Trails app.
+
+This module provides helpers for sharing the pipeline scripts' logging setup
+with the worker processes they start.
+"""
+
+import logging
+
+
+def init_worker_logging(log_path):
+    """
+    Send a worker process's log records to the parent's log file.
+    
+    Args:
+        log_path (Path): Log file of the parent process
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler(log_path),
+            logging.StreamHandler()
+        ],
+        force=True
+    )
@@ -6,8 +6,65 @@ This module provides utility functions for working with OpenStreetMap data,
 including parsing, filtering, and extracting relevant information.
 """
 
-import json
+import gzip
 import logging
+from functools import lru_cache
+from pathlib import Path
+
+import ijson
+import orjson
+
+# Tag values that mark a way or node as relevant for hiking
+TRAIL_HIGHWAYS = frozenset({'path', 'footway', 'track'})
+PARK_LEISURE = frozenset({'park', 'nature_reserve'})
+POI_TOURISM = frozenset({'viewpoint', 'information'})
+POI_AMENITIES = frozenset({'drinking_water', 'parking', 'toilets'})
+
+# Files up to this uncompressed size are parsed whole with orjson; larger ones
+# are streamed element by element to bound memory
+ORJSON_MAX_FILE_BYTES = 64 * 1024 * 1024
+
+
+def extract_all_from_osm_data(osm_data):
+    """
+    Extract nodes, ways and relations from OSM data in a single pass.
+    
+    Args:
+        osm_data (dict): Raw OSM data, or an iterable of OSM elements such as
+            iter_osm_elements returns
+        
+    Returns:
+        tuple: Dictionaries of nodes, ways and relations keyed by element ID
+    """
+    nodes = {}
+    ways = {}
+    relations = {}
+    
+    elements = osm_data.get('elements', []) if isinstance(osm_data, dict) else osm_data
+    for element in elements:
+        element_type = element.get('type')
+        element_id = element.get('id')
+        if not element_id:
+            continue
+        
+        if element_type == 'node':
+            nodes[element_id] = {
+                'lat': element.get('lat'),
+                'lon': element.get('lon'),
+                'tags': element.get('tags', {})
+            }
+        elif element_type == 'way':
+            ways[element_id] = {
+                'nodes': element.get('nodes', []),
+                'tags': element.get('tags', {})
+            }
+        elif element_type == 'relation':
+            relations[element_id] = {
+                'members': element.get('members', []),
+                'tags': element.get('tags', {})
+            }
+    
+    return nodes, ways, relations
 
 
 def extract_nodes_from_osm_data(osm_data):
@@ -15,24 +72,12 @@ def extract_nodes_from_osm_data(osm_data):
     Extract nodes from OSM data.
     
     Args:
-        osm_data (dict): Raw OSM data
+        osm_data (dict): Raw OSM data, or an iterable of OSM elements
         
     Returns:
         dict: Dictionary of nodes with node_id as key
     """
-    nodes = {}
-    
-    for element in osm_data.get('elements', []):
-        if element.get('type') == 'node':
-            node_id = element.get('id')
-            if node_id:
-                nodes[node_id] = {
-                    'lat': element.get('lat'),
-                    'lon': element.get('lon'),
-                    'tags': element.get('tags', {})
-                }
-    
-    return nodes
+    return extract_all_from_osm_data(osm_data)[0]
 
 
 def extract_ways_from_osm_data(osm_data):
@@ -40,23 +85,12 @@ def extract_ways_from_osm_data(osm_data):
     Extract ways from OSM data.
     
     Args:
-        osm_data (dict): Raw OSM data
+        osm_data (dict): Raw OSM data, or an iterable of OSM elements
         
     Returns:
         dict: Dictionary of ways with way_id as key
     """
-    ways = {}
-    
-    for element in osm_data.get('elements', []):
-        if element.get('type') == 'way':
-            way_id = element.get('id')
-            if way_id:
-                ways[way_id] = {
-                    'nodes': element.get('nodes', []),
-                    'tags': element.get('tags', {})
-                }
-    
-    return ways
+    return extract_all_from_osm_data(osm_data)[1]
 
 
 def extract_relations_from_osm_data(osm_data):
@@ -64,23 +98,12 @@ def extract_relations_from_osm_data(osm_data):
     Extract relations from OSM data.
     
     Args:
-        osm_data (dict): Raw OSM data
+        osm_data (dict): Raw OSM data, or an iterable of OSM elements
         
     Returns:
         dict: Dictionary of relations with relation_id as key
     """
-    relations = {}
-    
-    for element in osm_data.get('elements', []):
-        if element.get('type') == 'relation':
-            relation_id = element.get('id')
-            if relation_id:
-                relations[relation_id] = {
-                    'members': element.get('members', []),
-                    'tags': element.get('tags', {})
-                }
-    
-    return relations
+    return extract_all_from_osm_data(osm_data)[2]
 
 
 def filter_trail_ways(ways):
@@ -98,23 +121,12 @@ def filter_trail_ways(ways):
     for way_id, way_data in ways.items():
         tags = way_data.get('tags', {})
         
-        # Check if this way is likely to be a trail
-        is_trail = False
-        
-        # Check highway tag
-        highway = tags.get('highway')
-        if highway in ['path', 'footway', 'track']:
-            is_trail = True
-        
-        # Check route tag
-        route = tags.get('route')
-        if route == 'hiking':
-            is_trail = True
-        
-        # Check foot tag
-        foot = tags.get('foot')
-        if foot == 'yes':
-            is_trail = True
+        # Check if this way is likely to be a trail from its highway, route or foot tag
+        is_trail = (
+            tags.get('highway') in TRAIL_HIGHWAYS
+            or tags.get('route') == 'hiking'
+            or tags.get('foot') == 'yes'
+        )
         
         # Add to trail ways if it's a trail
         if is_trail:
@@ -138,18 +150,12 @@ def filter_park_ways(ways):
     for way_id, way_data in ways.items():
         tags = way_data.get('tags', {})
         
-        # Check if this way is likely to be a park or protected area
-        is_park = False
-        
-        # Check leisure tag
-        leisure = tags.get('leisure')
-        if leisure in ['park', 'nature_reserve']:
-            is_park = True
-        
-        # Check boundary tag
-        boundary = tags.get('boundary')
-        if boundary == 'protected_area':
-            is_park = True
+        # Check if this way is likely to be a park or protected area from its
+        # leisure or boundary tag
+        is_park = (
+            tags.get('leisure') in PARK_LEISURE
+            or tags.get('boundary') == 'protected_area'
+        )
         
         # Add to park ways if it's a park
         if is_park:
@@ -173,33 +179,15 @@ def filter_poi_nodes(nodes):
     for node_id, node_data in nodes.items():
         tags = node_data.get('tags', {})
         
-        # Check if this node is likely to be a POI for hiking
-        is_poi = False
-        
-        # Check tourism tag
-        tourism = tags.get('tourism')
-        if tourism in ['viewpoint', 'information']:
-            is_poi = True
-        
-        # Check natural tag
-        natural = tags.get('natural')
-        if natural == 'peak':
-            is_poi = True
-        
-        # Check amenity tag
-        amenity = tags.get('amenity')
-        if amenity in ['drinking_water', 'parking', 'toilets']:
-            is_poi = True
-        
-        # Check information tag
-        information = tags.get('information')
-        if information == 'guidepost':
-            is_poi = True
-        
-        # Check leisure tag
-        leisure = tags.get('leisure')
-        if leisure == 'picnic_table':
-            is_poi = True
+        # Check if this node is likely to be a POI for hiking from its
+        # tourism, natural, amenity, information or leisure tag
+        is_poi = (
+            tags.get('tourism') in POI_TOURISM
+            or tags.get('natural') == 'peak'
+            or tags.get('amenity') in POI_AMENITIES
+            or tags.get('information') == 'guidepost'
+            or tags.get('leisure') == 'picnic_table'
+        )
         
         # Add to POI nodes if it's a POI
         if is_poi:
@@ -216,6 +204,37 @@ def estimate_trail_difficulty(tags, length_miles=None):
         tags (dict): Trail tags
         length_miles (float): Trail length in miles
         
+    Returns:
+        str: Difficulty level ('Easy', 'Moderate', or 'Hard')
+    """
+    # Check trail length if available
+    length_difficulty = None
+    if length_miles:
+        if length_miles < 2:
+            length_difficulty = 'Easy'
+        elif length_miles < 5:
+            length_difficulty = 'Moderate'
+        else:
+            length_difficulty = 'Hard'
+    
+    # Most trails share a handful of tag combinations, so the tag checks are cached
+    return _difficulty_from_tags(
+        tags.get('sac_scale'), tags.get('trail_visibility'), tags.get('surface'), length_difficulty
+    )
+
+
+@lru_cache(maxsize=4096)
+def _difficulty_from_tags(sac_scale, trail_visibility, surface, length_difficulty):
+    """
+    Estimate trail difficulty from the tags that determine it.
+    
+    Args:
+        sac_scale (str): Value of the sac_scale tag
+        trail_visibility (str): Value of the trail_visibility tag
+        surface (str): Value of the surface tag
+        length_difficulty (str): Difficulty implied by the trail length, used
+            when none of the tags are set
+        
     Returns:
         str: Difficulty level ('Easy', 'Moderate', or 'Hard')
     """
@@ -223,7 +242,6 @@ def estimate_trail_difficulty(tags, length_miles=None):
     difficulty = 'Moderate'
     
     # Check sac_scale tag
-    sac_scale = tags.get('sac_scale')
     if sac_scale:
         if sac_scale in ['hiking', 'mountain_hiking']:
             difficulty = 'Easy'
@@ -234,7 +252,6 @@ def estimate_trail_difficulty(tags, length_miles=None):
         return difficulty
     
     # Check trail_visibility tag
-    trail_visibility = tags.get('trail_visibility')
     if trail_visibility:
         if trail_visibility in ['excellent', 'good']:
             difficulty = 'Easy'
@@ -245,7 +262,6 @@ def estimate_trail_difficulty(tags, length_miles=None):
         return difficulty
     
     # Check surface tag
-    surface = tags.get('surface')
     if surface:
         if surface in ['paved', 'asphalt', 'concrete', 'paving_stones']:
             difficulty = 'Easy'
@@ -257,14 +273,9 @@ def estimate_trail_difficulty(tags, length_miles=None):
             difficulty = 'Hard'
         return difficulty
     
-    # Check trail length if available
-    if length_miles:
-        if length_miles < 2:
-            difficulty = 'Easy'
-        elif length_miles < 5:
-            difficulty = 'Moderate'
-        else:
-            difficulty = 'Hard'
+    # Fall back to the trail length if available
+    if length_difficulty:
+        difficulty = length_difficulty
     
     return difficulty
 
@@ -299,7 +310,7 @@ def get_trail_name(tags, way_id=None):
 
 def load_osm_data(file_path):
     """
-    Load OSM data from a JSON file.
+    Load OSM data from a JSON file, which may be gzip-compressed.
     
     Args:
         file_path (str): Path to the JSON file
@@ -307,9 +318,54 @@ def load_osm_data(file_path):
     Returns:
         dict: OSM data
     """
+    opener = gzip.open if Path(file_path).suffix == '.gz' else open
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        with opener(file_path, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         logging.error(f"Error loading OSM data from {file_path}: {str(e)}")
         return {}
+
+
+def _uncompressed_size(file_path):
+    """
+    Get the size of a JSON file's contents, reading gzip files' ISIZE trailer.
+    
+    ISIZE holds the uncompressed size modulo 2**32, so the on-disk size is
+    used as a floor for contents of 4 GB or more.
+    
+    Args:
+        file_path (str): Path to the JSON file
+        
+    Returns:
+        int: Size of the uncompressed contents in bytes
+    """
+    size = Path(file_path).stat().st_size
+    if Path(file_path).suffix != '.gz' or size < 4:
+        return size
+    with open(file_path, 'rb') as f:
+        f.seek(-4, 2)
+        isize = int.from_bytes(f.read(4), 'little')
+    return max(isize, size)
+
+
+def iter_osm_elements(file_path):
+    """
+    Iterate over the elements of an OSM JSON file, which may be gzip-compressed.
+    
+    Files whose uncompressed contents are larger than ORJSON_MAX_FILE_BYTES are
+    streamed with ijson, so the whole document is never held in memory; smaller
+    ones are parsed at once with orjson, which is faster.
+    
+    Args:
+        file_path (str): Path to the JSON file
+        
+    Returns:
+        generator: OSM elements as dictionaries
+    """
+    opener = gzip.open if Path(file_path).suffix == '.gz' else open
+    with opener(file_path, 'rb') as f:
+        if _uncompressed_size(file_path) <= ORJSON_MAX_FILE_BYTES:
+            yield from orjson.loads(f.read()).get('elements', [])
+        else:
+            yield from ijson.items(f, 'elements.item', use_float=True)
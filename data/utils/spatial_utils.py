@@ -7,6 +7,7 @@ including distance calculations, geometric operations, and coordinate transforma
 """
 
 import numpy as np
+import shapely
 from shapely.geometry import Point, LineString, MultiLineString
 import geopandas as gpd
 from math import radians, cos, sin, asin, sqrt
@@ -37,23 +38,52 @@ def haversine(lon1, lat1, lon2, lat2):
     return c * r
 
 
+def haversine_precomputed(lon1, lat1, cos_lat1, lon2, lat2, cos_lat2):
+    """
+    Calculate great circle distances in miles between arrays of points whose
+    coordinates are already in radians.
+    
+    Passing cos(latitude) in lets callers compute it once per point rather
+    than once per pair of points.
+    
+    Args:
+        lon1 (numpy.ndarray): Longitudes of the first points in radians
+        lat1 (numpy.ndarray): Latitudes of the first points in radians
+        cos_lat1 (numpy.ndarray): Cosines of the first points' latitudes
+        lon2 (numpy.ndarray): Longitudes of the second points in radians
+        lat2 (numpy.ndarray): Latitudes of the second points in radians
+        cos_lat2 (numpy.ndarray): Cosines of the second points' latitudes
+        
+    Returns:
+        numpy.ndarray: Distances in miles
+    """
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat/2)**2 + cos_lat1 * cos_lat2 * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = 3956  # Radius of earth in miles
+    return c * r
+
+
 def calculate_trail_length(coordinates):
     """
     Calculate the length of a trail in miles based on its coordinates.
     
     Args:
-        coordinates (list): List of (longitude, latitude) tuples
+        coordinates (list): List of (longitude, latitude) tuples, or an (n, 2) array
         
     Returns:
         float: Trail length in miles
     """
-    length = 0
-    for i in range(len(coordinates) - 1):
-        lon1, lat1 = coordinates[i]
-        lon2, lat2 = coordinates[i + 1]
-        length += haversine(lon1, lat1, lon2, lat2)
+    # Sum the distances between consecutive points in one vectorized pass
+    coords = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    if len(coords) < 2:
+        return 0.0
     
-    return length
+    lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    cos_lat = np.cos(lat)
+    return float(haversine_precomputed(lon[:-1], lat[:-1], cos_lat[:-1], lon[1:], lat[1:], cos_lat[1:]).sum())
 
 
 def create_line_string(coordinates):
@@ -98,7 +128,10 @@ def find_intersecting_trails(trail_geometry, all_trails_gdf):
     Returns:
         geopandas.GeoDataFrame: GeoDataFrame containing intersecting trails
     """
-    return all_trails_gdf[all_trails_gdf.intersects(trail_geometry)]
+    # Query the GeoDataFrame's STRtree spatial index, which geopandas builds on
+    # first use and keeps for later queries, instead of testing every trail
+    matches = all_trails_gdf.sindex.query(trail_geometry, predicate='intersects')
+    return all_trails_gdf.iloc[np.sort(matches)]
 
 
 def find_nearby_pois(trail_geometry, pois_gdf, distance_miles=0.1):
@@ -119,19 +152,22 @@ def find_nearby_pois(trail_geometry, pois_gdf, distance_miles=0.1):
     # Buffer the trail
     trail_buffer = trail_geometry.buffer(distance_degrees)
     
-    # Find POIs within the buffer
-    return pois_gdf[pois_gdf.intersects(trail_buffer)]
+    # Find POIs within the buffer through the spatial index
+    matches = pois_gdf.sindex.query(trail_buffer, predicate='intersects')
+    return pois_gdf.iloc[np.sort(matches)]
 
 
 def simplify_geometry(geometry, tolerance=0.0001):
     """
-    Simplify a geometry to reduce the number of points.
+    Simplify a geometry, or an array of geometries, to reduce the number of points.
+    
+    Arrays are simplified in a single vectorized GEOS call.
     
     Args:
-        geometry (shapely.geometry.BaseGeometry): Geometry to simplify
+        geometry (shapely.geometry.BaseGeometry or array-like): Geometry or geometries to simplify
         tolerance (float): Tolerance for simplification
         
     Returns:
-        shapely.geometry.BaseGeometry: Simplified geometry
+        shapely.geometry.BaseGeometry or numpy.ndarray: Simplified geometry or geometries
     """
-    return geometry.simplify(tolerance)
+    return shapely.simplify(geometry, tolerance)
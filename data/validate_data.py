@@ -6,24 +6,33 @@ This script validates the processed trail data and generates visualizations
 to help verify the quality and completeness of the data.
 
 Usage:
-    python validate_data.py [--county COUNTY]
+    python validate_data.py [--county COUNTY] [--force]
 
 Options:
     --county COUNTY   Only validate data for the specified county
+    --force           Regenerate visualizations even if they are up to date
 """
 
 import os
-import json
 import logging
 import argparse
 import sqlite3
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import matplotlib
+matplotlib.use('Agg')  # Render to files only, so worker processes never open a display
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+import orjson
 from pathlib import Path
 from datetime import datetime
 
+from utils import init_worker_logging
+
 # Set up logging
 log_dir = Path("data/logs")
 log_dir.mkdir(exist_ok=True)
@@ -46,41 +55,85 @@ VISUALIZATIONS_DIR.mkdir(exist_ok=True)
 ASSETS_DIR = Path("assets")
 DB_PATH = ASSETS_DIR / "trails.db"
 
+# Visualizations generated for each county
+COUNTY_VISUALIZATIONS = ['trails_map.png', 'trail_length_distribution.png', 'difficulty_distribution.png']
+
+# Column types for reading the trail points CSV files; sequence is a nullable
+# integer so missing values can still be counted rather than failing the read
+TRAIL_POINT_COLUMNS = ['trail_id', 'sequence', 'latitude', 'longitude']
+TRAIL_POINT_DTYPES = {'trail_id': 'string', 'sequence': 'Int32', 'latitude': 'float64', 'longitude': 'float64'}
+
+# PRAGMAs for the validation queries, which only read and scan whole tables
+VALIDATION_PRAGMAS = """
+PRAGMA query_only=ON;
+PRAGMA cache_size=-65536;
+"""
+
 
-def validate_trails_data(county):
+def load_trails_data(county):
     """
-    Validate trails data for a specific county.
+    Load trails data for a specific county.
     
     Args:
         county (str): County name
         
     Returns:
-        tuple: (bool, dict) - Success flag and validation results
+        geopandas.GeoDataFrame: Trails data, or None if it could not be loaded
     """
     county_lower = county.lower()
     trails_file = PROCESSED_DATA_DIR / f"{county_lower}_trails.geojson"
     
     if not trails_file.exists():
         logging.warning(f"Trails data file not found: {trails_file}")
-        return False, {}
+        return None
     
     try:
-        # Load trails data
-        gdf = gpd.read_file(trails_file)
+        # Load trails data with pyogrio's vectorized Arrow reader
+        gdf = gpd.read_file(trails_file, engine='pyogrio', use_arrow=True)
+        
+        # Store the few difficulty levels as a categorical, so counting them
+        # works on integer codes instead of hashing every string
+        gdf['difficulty'] = gdf['difficulty'].astype('category')
+        
+        return gdf
+    
+    except Exception as e:
+        logging.error(f"Error loading trails data for {county}: {str(e)}")
+        return None
+
+
+def validate_trails_data(county, gdf):
+    """
+    Validate trails data for a specific county.
+    
+    Args:
+        county (str): County name
+        gdf (geopandas.GeoDataFrame): Trails data for the county
+        
+    Returns:
+        tuple: (bool, dict) - Success flag and validation results
+    """
+    try:
+        # Check all attribute columns for missing values in one pass
+        present = gdf[['name', 'difficulty', 'length_miles', 'start_lat', 'start_lon']].notna()
+        present_counts = present.sum()
+        
+        # Compute all length statistics in one aggregation
+        length_stats = gdf['length_miles'].agg(['mean', 'min', 'max', 'sum'])
         
         # Validate data
         results = {
             'county': county,
             'trail_count': len(gdf),
-            'has_name': gdf['name'].notna().sum(),
-            'has_difficulty': gdf['difficulty'].notna().sum(),
-            'has_length': gdf['length_miles'].notna().sum(),
-            'has_start_coords': (gdf['start_lat'].notna() & gdf['start_lon'].notna()).sum(),
+            'has_name': present_counts['name'],
+            'has_difficulty': present_counts['difficulty'],
+            'has_length': present_counts['length_miles'],
+            'has_start_coords': (present['start_lat'] & present['start_lon']).sum(),
             'difficulty_counts': gdf['difficulty'].value_counts().to_dict(),
-            'avg_length': gdf['length_miles'].mean(),
-            'min_length': gdf['length_miles'].min(),
-            'max_length': gdf['length_miles'].max(),
-            'total_length': gdf['length_miles'].sum()
+            'avg_length': length_stats['mean'],
+            'min_length': length_stats['min'],
+            'max_length': length_stats['max'],
+            'total_length': length_stats['sum']
         }
         
         # Check for issues
@@ -140,17 +193,25 @@ def validate_trail_points_data(county):
         return False, {}
     
     try:
-        # Load trail points data
-        df = pd.read_csv(points_file)
+        # Load trail points data with fixed columns and types, skipping type inference
+        df = pd.read_csv(points_file, engine='pyarrow', usecols=TRAIL_POINT_COLUMNS, dtype=TRAIL_POINT_DTYPES)
+        
+        # Check all point columns for missing values in one pass
+        present = df[['latitude', 'longitude', 'sequence']].notna()
+        
+        # Count points per trail from a single factorization of the trail IDs,
+        # which also gives the number of distinct trails
+        trail_codes, trail_ids = pd.factorize(df['trail_id'])
+        points_per_trail = np.bincount(trail_codes[trail_codes >= 0])
         
         # Validate data
         results = {
             'county': county,
             'point_count': len(df),
-            'trail_count': df['trail_id'].nunique(),
-            'has_coords': (df['latitude'].notna() & df['longitude'].notna()).sum(),
-            'has_sequence': df['sequence'].notna().sum(),
-            'points_per_trail': df.groupby('trail_id').size().describe().to_dict()
+            'trail_count': len(trail_ids),
+            'has_coords': (present['latitude'] & present['longitude']).sum(),
+            'has_sequence': present['sequence'].sum(),
+            'points_per_trail': pd.Series(points_per_trail).describe().to_dict()
         }
         
         # Check for issues
@@ -200,17 +261,21 @@ def validate_database():
     try:
         # Connect to database
         conn = sqlite3.connect(DB_PATH)
+        conn.executescript(VALIDATION_PRAGMAS)
         cursor = conn.cursor()
         
-        # Get table counts
-        cursor.execute("SELECT COUNT(*) FROM trails")
-        trails_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM trail_points")
-        points_count = cursor.fetchone()[0]
+        # Run all queries in one read transaction, so the shared lock is taken once
+        cursor.execute("BEGIN")
         
-        cursor.execute("SELECT COUNT(DISTINCT trail_id) FROM trail_points")
-        trails_with_points = cursor.fetchone()[0]
+        # Get table counts in one round trip; the distinct trail count is read
+        # from the trail_id index
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM trails),
+                (SELECT COUNT(*) FROM trail_points),
+                (SELECT COUNT(DISTINCT trail_id) FROM trail_points)
+        """)
+        trails_count, points_count, trails_with_points = cursor.fetchone()
         
         # Get metadata
         cursor.execute("SELECT * FROM app_metadata")
@@ -224,6 +289,8 @@ def validate_database():
         cursor.execute("SELECT difficulty, COUNT(*) FROM trails GROUP BY difficulty")
         difficulty_counts = {row[0]: row[1] for row in cursor.fetchall()}
         
+        conn.commit()
+        
         # Validate data
         results = {
             'trails_count': trails_count,
@@ -273,31 +340,53 @@ def validate_database():
         return False, {}
 
 
-def visualize_trails(county):
+def visualizations_up_to_date(county):
     """
-    Generate visualizations for trails in a specific county.
+    Check if a county's visualizations are newer than its trails data.
     
     Args:
         county (str): County name
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if every visualization exists and is up to date, False otherwise
     """
     county_lower = county.lower()
     trails_file = PROCESSED_DATA_DIR / f"{county_lower}_trails.geojson"
+    county_dir = VISUALIZATIONS_DIR / county_lower
     
-    if not trails_file.exists():
-        logging.warning(f"Trails data file not found: {trails_file}")
-        return False
+    trails_mtime = trails_file.stat().st_mtime
+    for name in COUNTY_VISUALIZATIONS:
+        output_path = county_dir / name
+        if not output_path.exists() or output_path.stat().st_mtime < trails_mtime:
+            return False
     
-    try:
-        # Load trails data
-        gdf = gpd.read_file(trails_file)
+    return True
+
+
+def visualize_trails(county, gdf, force=False):
+    """
+    Generate visualizations for trails in a specific county.
+    
+    Args:
+        county (str): County name
+        gdf (geopandas.GeoDataFrame): Trails data for the county
+        force (bool): Regenerate visualizations even if they are up to date
         
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    county_lower = county.lower()
+    
+    try:
         if len(gdf) == 0:
             logging.warning(f"No trails found for {county}")
             return False
         
+        # Check if visualizations should be regenerated
+        if not force and visualizations_up_to_date(county):
+            logging.info(f"Skipping visualizations for {county} County (up to date)")
+            return True
+        
         # Create output directory
         county_dir = VISUALIZATIONS_DIR / county_lower
         county_dir.mkdir(exist_ok=True)
@@ -392,10 +481,10 @@ def generate_summary_report(validation_results):
             for issue in validation_results.get('database', {}).get('issues', []):
                 report['issues'].append(f"Database: {issue}")
         
-        # Save report
+        # Save report; orjson serializes the NumPy values from the validation directly
         report_path = VISUALIZATIONS_DIR / 'validation_report.json'
-        with open(report_path, 'w') as f:
-            json.dump(report, f, indent=2)
+        with open(report_path, 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
         
         # Generate summary visualization
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
@@ -409,13 +498,12 @@ def generate_summary_report(validation_results):
         ax1.set_ylabel('Number of Trails')
         ax1.tick_params(axis='x', rotation=45)
         
-        # Difficulty distribution across all counties
-        difficulty_counts = {'Easy': 0, 'Moderate': 0, 'Hard': 0}
-        
-        for county, stats in report['county_stats'].items():
-            for difficulty, count in stats['difficulty_distribution'].items():
-                if difficulty in difficulty_counts:
-                    difficulty_counts[difficulty] += count
+        # Difficulty distribution across all counties, keeping every level in
+        # a fixed order so each always gets the same pie colour
+        difficulty_totals = Counter()
+        for stats in report['county_stats'].values():
+            difficulty_totals.update(stats['difficulty_distribution'])
+        difficulty_counts = {difficulty: difficulty_totals[difficulty] for difficulty in ('Easy', 'Moderate', 'Hard')}
         
         ax2.pie(difficulty_counts.values(), labels=difficulty_counts.keys(),
                autopct='%1.1f%%', colors=['green', 'orange', 'red'])
@@ -433,12 +521,53 @@ def generate_summary_report(validation_results):
         return False
 
 
-def validate_data(counties=None):
+def validate_county(county, force=False):
+    """
+    Validate and visualize data for a specific county.
+    
+    Args:
+        county (str): County name
+        force (bool): Regenerate visualizations even if they are up to date
+        
+    Returns:
+        tuple: (bool, dict) - Success flag and trails and points validation results
+    """
+    logging.info(f"Validating data for {county} County")
+    success = True
+    
+    # Load trails data once for both validation and visualization
+    gdf = load_trails_data(county)
+    
+    # Validate trails data
+    trails_success, trails_results = False, {}
+    if gdf is not None:
+        trails_success, trails_results = validate_trails_data(county, gdf)
+    if not trails_success:
+        success = False
+    
+    # Validate trail points data
+    points_success, points_results = validate_trail_points_data(county)
+    if not points_success:
+        success = False
+    
+    # Generate visualizations
+    if trails_success:
+        if not visualize_trails(county, gdf, force):
+            success = False
+    
+    return success, {
+        'trails': trails_results,
+        'points': points_results
+    }
+
+
+def validate_data(counties=None, force=False):
     """
     Validate data for specified counties.
     
     Args:
         counties (list): List of counties to validate, or None for all counties
+        force (bool): Regenerate visualizations even if they are up to date
         
     Returns:
         bool: True if validation was successful, False otherwise
@@ -446,33 +575,21 @@ def validate_data(counties=None):
     if counties is None:
         counties = COUNTIES
     
+    # Counties are independent, so validate them in parallel worker processes
+    if len(counties) == 1:
+        county_results = [validate_county(counties[0], force)]
+    else:
+        max_workers = min(len(counties), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logging, initargs=(log_file,)) as executor:
+            county_results = list(executor.map(partial(validate_county, force=force), counties))
+    
+    # Store results
     validation_results = {}
     success = True
-    
-    # Validate each county
-    for county in counties:
-        logging.info(f"Validating data for {county} County")
-        
-        # Validate trails data
-        trails_success, trails_results = validate_trails_data(county)
-        if not trails_success:
+    for county, (county_success, results) in zip(counties, county_results):
+        validation_results[county] = results
+        if not county_success:
             success = False
-        
-        # Validate trail points data
-        points_success, points_results = validate_trail_points_data(county)
-        if not points_success:
-            success = False
-        
-        # Generate visualizations
-        if trails_success:
-            if not visualize_trails(county):
-                success = False
-        
-        # Store results
-        validation_results[county] = {
-            'trails': trails_results,
-            'points': points_results
-        }
     
     # Validate database
     db_success, db_results = validate_database()
@@ -497,6 +614,7 @@ def parse_arguments():
     """
     parser = argparse.ArgumentParser(description="Validate and visualize trail data")
     parser.add_argument("--county", choices=COUNTIES, help="Only validate data for the specified county")
+    parser.add_argument("--force", action="store_true", help="Regenerate visualizations even if they are up to date")
     
     return parser.parse_args()
 
@@ -509,7 +627,7 @@ def main():
     
     counties = [args.county] if args.county else None
     
-    if validate_data(counties):
+    if validate_data(counties, args.force):
         logging.info("Data validation completed successfully")
         return 0
     else:
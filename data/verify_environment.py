@@ -1,77 +1,101 @@
 #!/usr/bin/env python3
 """
 Verify that the Python environment is set up correctly.
-This script attempts to import all the required packages and prints a success message if all imports work.
+This script checks that all the required packages are installed and prints a success message if they all are.
+With --deep it imports each package instead and reports its version.
 """
 
 import sys
 import os
+import argparse
+import importlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-def check_imports():
-    """Check that all required packages can be imported."""
+# Packages to check, as (package name, import name) pairs
+PACKAGES = [
+    ("pandas", "pandas"),
+    ("geopandas", "geopandas"),
+    ("pyogrio", "pyogrio"),
+    ("numpy", "numpy"),
+    ("scipy", "scipy"),
+    ("pyarrow", "pyarrow"),
+    ("shapely", "shapely"),
+    ("ijson", "ijson"),
+    ("orjson", "orjson"),
+    ("requests", "requests"),
+    ("osmnx", "osmnx"),
+    ("beautifulsoup4", "bs4"),
+    ("matplotlib", "matplotlib"),
+    ("python-dotenv", "dotenv")
+]
+
+def find_package(import_name):
+    """Check that a package is installed without importing it."""
+    return importlib.util.find_spec(import_name) is not None
+
+def check_imports(deep=False):
+    """Check that all required packages are installed, importing them if deep is set."""
     print("Verifying Python environment setup...")
     print(f"Python version: {sys.version}")
     print(f"Current working directory: {os.getcwd()}")
     print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("\nAttempting to import required packages:")
-    
-    # List of packages to check
-    packages = [
-        "pandas",
-        "geopandas",
-        "numpy",
-        "shapely",
-        "requests",
-        "overpass",
-        "osmnx",
-        "beautifulsoup4",
-        "matplotlib",
-        "dotenv"
-    ]
+    if deep:
+        print("\nAttempting to import required packages:")
+    else:
+        print("\nLooking for required packages:")
     
-    # Try to import each package
     successful_imports = []
     failed_imports = []
     
-    for package in packages:
-        try:
-            if package == "beautifulsoup4":
-                import bs4
-                print(f"✅ {package} (as bs4) {bs4.__version__}")
-                successful_imports.append(package)
-            elif package == "dotenv":
-                import dotenv
-                # python-dotenv might not have __version__ attribute
-                version = getattr(dotenv, "__version__", "version not available")
-                print(f"✅ {package} {version}")
-                successful_imports.append(package)
-            else:
-                module = __import__(package)
+    if deep:
+        # Try to import each package
+        for package, import_name in PACKAGES:
+            try:
+                module = importlib.import_module(import_name)
+                # Some packages, such as python-dotenv, have no __version__ attribute
                 version = getattr(module, "__version__", "unknown version")
                 print(f"✅ {package} {version}")
                 successful_imports.append(package)
-        except ImportError:
-            print(f"❌ {package} (import failed)")
-            failed_imports.append(package)
-        except Exception as e:
-            print(f"❌ {package} (error: {str(e)})")
-            failed_imports.append(package)
+            except ImportError:
+                print(f"❌ {package} (import failed)")
+                failed_imports.append(package)
+            except Exception as e:
+                print(f"❌ {package} (error: {str(e)})")
+                failed_imports.append(package)
+    else:
+        # Only look up each package's module spec, which doesn't run any package
+        # code; the lookups are mostly filesystem checks, so run them concurrently
+        with ThreadPoolExecutor() as executor:
+            found = list(executor.map(find_package, [import_name for _, import_name in PACKAGES]))
+        
+        for (package, _), is_found in zip(PACKAGES, found):
+            if is_found:
+                print(f"✅ {package}")
+                successful_imports.append(package)
+            else:
+                print(f"❌ {package} (not found)")
+                failed_imports.append(package)
     
     # Print summary
     print("\nSummary:")
-    print(f"Successfully imported {len(successful_imports)} of {len(packages)} packages.")
+    print(f"Successfully {'imported' if deep else 'found'} {len(successful_imports)} of {len(PACKAGES)} packages.")
     
     if failed_imports:
-        print("\nFailed imports:")
+        print("\nFailed imports:" if deep else "\nMissing packages:")
         for package in failed_imports:
             print(f"- {package}")
         print("\nPlease check your installation and try again.")
         return False
     else:
-        print("\nAll packages imported successfully! Your environment is ready.")
+        print(f"\nAll packages {'imported' if deep else 'found'} successfully! Your environment is ready.")
         return True
 
 if __name__ == "__main__":
-    success = check_imports()
+    parser = argparse.ArgumentParser(description="Verify the Python environment setup")
+    parser.add_argument("--deep", action="store_true", help="Import each package and report its version")
+    args = parser.parse_args()
+    
+    success = check_imports(args.deep)
     sys.exit(0 if success else 1)